@@ -9,9 +9,15 @@ from aiogram.fsm.storage.memory import MemoryStorage
 
 from src.handlers import router
 from src.userbot.client import userbot
+from src.userbot.sources import source_registry
+from src.utils.ai import close_client as close_ai_client, load_settings as load_ai_settings
+from src.utils.ai_batch import resume_backlog_rewrite
 from src.utils.config import settings
 from src.utils.middlewares import DataBaseMiddleware, AdminOnlyMiddleware
 from src.utils.db import create_tables, close_db, async_session_maker
+from src.utils.pg_notify import pg_listener
+from src.utils.rewrite_scheduler import rewrite_scheduler
+from src.utils.throttle import SendThrottleMiddleware
 
 logging.basicConfig(
     level=logging.INFO,
@@ -32,8 +38,13 @@ async def start_userbot():
 async def main():
 
     await create_tables()
+    await load_ai_settings()
+    await source_registry.load()
+    source_registry.start()
+    await pg_listener.start()
 
     session = AiohttpSession()
+    session.middleware(SendThrottleMiddleware())
     bot = Bot(
         token=settings.BOT_TOKEN,
         session=session,
@@ -41,6 +52,8 @@ async def main():
               )
 
     userbot.set_bot(bot)
+    rewrite_scheduler.start()
+    await resume_backlog_rewrite()
 
     dp = Dispatcher(storage=MemoryStorage())
 
@@ -65,6 +78,10 @@ async def main():
         if userbot_task:
             userbot_task.cancel()
             await userbot.stop()
+        await rewrite_scheduler.stop()
+        await source_registry.stop()
+        await pg_listener.stop()
+        await close_ai_client()
         await close_db()
         await bot.session.close()
 
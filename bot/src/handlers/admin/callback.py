@@ -4,15 +4,17 @@ src/handlers/admin/callback.py
 """
 
 import asyncio
-import json
+import html
 import logging
 
 from aiogram import Router, Bot, F
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.fsm.context import FSMContext
-from aiogram.types import CallbackQuery, BufferedInputFile, InputMediaPhoto, InputMediaVideo, InputMediaDocument
+from aiogram.types import CallbackQuery
 
 from sqlalchemy import select, delete
 from sqlalchemy.ext.asyncio import AsyncSession
+from telethon.errors import FloodWaitError
 
 from src.keyboards.admin_channels import sources_menu_kb
 from src.keyboards.ai_keyboard import ai_settings_kb
@@ -21,26 +23,28 @@ from src.models.channel import Channel
 from src.models.media_item import MediaItem
 from src.models.post import Post
 from src.states.admin_states import AdminStates
-from src.userbot.client import userbot
-from src.userbot.publisher import publish_post
+from src.userbot.catchup import catch_up
+from src.userbot.outbox import notification_outbox
+from src.userbot.ingest import ingest_writer
+from src.userbot.ingest_queue import ingest_queue
+from src.userbot.message_cache import message_cache
+from src.userbot.monitor import monitor
+from src.userbot.preview import send_preview
+from src.userbot.publish_queue import publish_queue, publish_tz
+from src.userbot.publisher import PartialPublishError, publish_post
+from src.userbot.shards import shard_pool
+from src.utils.config import settings
 from src.utils.db import session
-from src.utils.ai import is_enabled, rewrite_text, get_model
-from src.utils.tg_format import md_to_html, split_html_safe, split_caption_and_tail
-from src.utils.utils import safe_delete_message
+from src.utils.ai import is_enabled, rewrite_text, stream_rewrite, get_model, get_prompt_cache
+from src.utils.ai_batch import start_backlog_rewrite
+from src.utils.prerewrite import prerewriter
+from src.utils.rewrite_scheduler import rewrite_scheduler
+from src.utils.tg_format import md_to_html, split_html_safe, safe_html_prefix
+from src.utils.utils import safe_delete_message, load_admin_messages, delete_admin_messages
 
 router = Router()
 logger = logging.getLogger(__name__)
 
-def has_real_file(msg) -> bool:
-    """Проверяет, есть ли реальный файл"""
-    from telethon.tl.types import MessageMediaWebPage
-    if not msg or not msg.media:
-        return False
-    if isinstance(msg.media, MessageMediaWebPage):
-        return False
-    return bool(msg.photo or msg.video or msg.document or msg.audio or msg.voice)
-
-
 async def delete_preview(bot: Bot, user_id: int, state: FSMContext, skip_msg_id: int | None = None):
     data = await state.get_data()
     preview_msg_ids = data.get("preview_msg_ids", [])
@@ -52,9 +56,64 @@ async def delete_preview(bot: Bot, user_id: int, state: FSMContext, skip_msg_id:
     await state.update_data(preview_msg_ids=[], control_msg_ids=[])
 
 
+async def stream_rewrite_preview(
+        bot: Bot,
+        admin_id: int,
+        state: FSMContext,
+        text: str,
+        mode: str,
+        fresh: bool
+) -> tuple[str, int]:
+    """
+    Потоковый рерайт в одно сообщение-заглушку.
+    Правки не чаще REWRITE_STREAM_EDIT_INTERVAL (лимит Telegram на чат).
+    Возвращает (полный текст, message_id заглушки).
+    """
+    placeholder = await bot.send_message(admin_id, "⏳ Переписываю...")
+    await state.update_data(preview_msg_ids=[placeholder.message_id])
+
+    loop = asyncio.get_running_loop()
+    next_edit_at = 0.0
+    shown = ""
+    result = ""
+
+    try:
+        async for partial in stream_rewrite(text, mode, fresh=fresh):
+            result = partial
+            now = loop.time()
+            if now < next_edit_at:
+                continue
+
+            preview = safe_html_prefix(md_to_html(partial))
+            if not preview or preview == shown:
+                continue
+
+            try:
+                await bot.edit_message_text(
+                    preview + " ▌",
+                    chat_id=admin_id,
+                    message_id=placeholder.message_id,
+                    parse_mode="HTML",
+                    disable_web_page_preview=True
+                )
+                shown = preview
+            except TelegramRetryAfter as e:
+                now += e.retry_after
+            except TelegramBadRequest as e:
+                logger.debug(f"Stream edit skipped: {e}")
+
+            next_edit_at = now + settings.REWRITE_STREAM_EDIT_INTERVAL
+    except asyncio.CancelledError:
+        # задачу заменили другим режимом или пост удалён — заглушку не оставляем
+        await safe_delete_message(bot, admin_id, placeholder.message_id)
+        raise
+
+    return result, placeholder.message_id
+
+
 
 @router.callback_query(F.data.startswith("adm:"))
-async def admin_callbacks(c: CallbackQuery, state: FSMContext, db: AsyncSession):
+async def admin_callbacks(c: CallbackQuery, bot: Bot, state: FSMContext, db: AsyncSession):
     cmd = c.data.split(":")[1]
 
     if cmd == "sources":
@@ -75,7 +134,7 @@ async def admin_callbacks(c: CallbackQuery, state: FSMContext, db: AsyncSession)
             f"⚙️ <b>Настройки AI</b>\n\n"
             f"Текущая модель: <code>{model}</code>\n\n"
             f"Выберите действие:",
-            reply_markup=ai_settings_kb(),
+            reply_markup=ai_settings_kb(await get_prompt_cache()),
             parse_mode="HTML"
         )
         await c.answer()
@@ -90,6 +149,26 @@ async def admin_callbacks(c: CallbackQuery, state: FSMContext, db: AsyncSession)
         await c.answer()
         return
 
+    if cmd == "backlog":
+        if not is_enabled():
+            await c.answer("ANTHROPIC_API_KEY не задан", show_alert=True)
+            return
+
+        status = await bot.send_message(c.from_user.id, "📦 Собираю непереписанные посты...", parse_mode="HTML")
+
+        async def progress(text: str):
+            try:
+                await status.edit_text(text, parse_mode="HTML")
+            except TelegramBadRequest:
+                pass
+
+        if start_backlog_rewrite("std", progress):
+            await c.answer("📦 Рерайт бэклога запущен")
+        else:
+            await safe_delete_message(bot, c.from_user.id, status.message_id)
+            await c.answer("Рерайт бэклога уже идёт", show_alert=True)
+        return
+
     if cmd == "list_links":
         target = (await db.execute(
             select(Channel).where(Channel.role == "target", Channel.is_active == True))).scalars().first()
@@ -101,10 +180,85 @@ async def admin_callbacks(c: CallbackQuery, state: FSMContext, db: AsyncSession)
         text += f"🎯 Target: {target.chat_id if target else 'не задан'}\n\n"
         text += f"📡 Источников: {len(sources)}"
 
+        for shard in shard_pool.stats():
+            state = "✅" if shard["healthy"] else (f"⏳ FloodWait {shard['flood_left']:.0f}с" if shard["flood_left"] else "❌")
+            text += (
+                f"\n👤 {shard['name']}: {state}, источников {shard['sources']}, "
+                f"в работе {shard['in_flight']}, FloodWait {shard['floods']}"
+            )
+
+        cache = message_cache.stats()
+        text += (
+            f"\n\n🗂 Кеш сообщений: {cache['size']} шт., попаданий {cache['hits']} "
+            f"({cache['hit_rate']:.0%}), промахов {cache['misses']}, обновлений file_reference {cache['refreshes']}"
+        )
+
+        albums = monitor.album_stats()
+        hist = ", ".join(f"{label}: {count}" for label, count in albums["latency_hist"].items())
+        text += (
+            f"\n🧩 Альбомы: собрано {albums['flushed']}, в сборке {albums['pending']}, "
+            f"ср. {albums['latency_avg']:.2f}с, по лимиту {albums['capped']}, опоздавших частей {albums['late_parts']}\n"
+            f"   {hist}"
+        )
+
+        ingest = ingest_writer.stats()
+        text += (
+            f"\n💾 Запись постов: пачек {ingest['batches']}, постов {ingest['posts']}, "
+            f"дублей {ingest['duplicates']}, ошибок {ingest['failed']} (пачек по одному {ingest['retried']}), "
+            f"размер ср. {ingest['batch_avg']:.1f} / макс. {ingest['batch_max']}, "
+            f"коммит ср. {ingest['commit_avg'] * 1000:.0f}мс"
+        )
+
+        queue = ingest_queue.stats()
+        text += (
+            f"\n📥 Очередь приёма ({queue['policy']}): сейчас {queue['depth']}, макс. {queue['depth_max']}, "
+            f"обработано {queue['processed']}, ошибок {queue['failed']}, "
+            f"отброшено {queue['dropped']}, отложено в БД {queue['spilled']} (ждут {queue['spill_backlog']}), "
+            f"ожидание ср. {queue['wait_avg']:.2f}с / макс. {queue['wait_max']:.2f}с"
+        )
+
+        caught = catch_up.stats()
+        text += (
+            f"\n🔁 Догон после простоя: запусков {caught['runs']}, "
+            f"последний — {caught['last_recovered']} постов за {caught['last_duration']:.1f}с, "
+            f"всего восстановлено {caught['total_recovered']}"
+        )
+
+        outbox = await notification_outbox.stats()
+        text += (
+            f"\n📨 Уведомления админам: в очереди {outbox['pending']}, поставлено {outbox['enqueued']}, "
+            f"доставлено {outbox['delivered']} ({outbox['per_minute']}/мин), повторов {outbox['retried']}, "
+            f"не доставлено {outbox['failed']}, задержка ср. {outbox['latency_avg']:.1f}с"
+        )
+
         await c.message.edit_text(text, reply_markup=admin_menu_kb())
         await c.answer()
         return
 
+    if cmd == "publish_queue":
+        tz = publish_tz()
+        items, total = await publish_queue.upcoming()
+        free_slot = await publish_queue.next_free_slot()
+        stats = publish_queue.stats()
+
+        text = f"🗓 Очередь публикаций ({settings.PUBLISH_TIMEZONE}): ждут {total}\n\n"
+        for item in items:
+            preview = " ".join(item.text.split())[:50] or "(без текста)"
+            retry = f" 🔁{item.attempts}" if item.attempts else ""
+            text += f"• {item.slot_at.astimezone(tz):%d.%m %H:%M} — #{item.post_id}{retry}: {preview}\n"
+        if total > len(items):
+            text += f"… и ещё {total - len(items)}\n"
+
+        text += f"\nСледующий свободный слот: {free_slot.astimezone(tz):%d.%m %H:%M}"
+        text += (
+            f"\nОпубликовано {stats['published']}, повторов {stats['retried']}, "
+            f"не удалось {stats['failed']}, снято {stats['cancelled']}"
+        )
+
+        await c.message.edit_text(html.escape(text), reply_markup=admin_menu_kb())
+        await c.answer()
+        return
+
 
 @router.callback_query(F.data.startswith("p:"))
 async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FSMContext):
@@ -136,7 +290,6 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
         media_items = (await db.execute(
             select(MediaItem).where(MediaItem.post_id == post_id).order_by(MediaItem.sort_index.asc())
         )).scalars().all()
-        has_media = bool(media_items)
 
         preview_ids = await send_preview_via_bot(
             bot=bot,
@@ -144,7 +297,7 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
             text=(post.original_text or "").strip(),
             source_chat_id=post.source_chat_id,
             source_message_id=post.source_message_id,
-            has_media=has_media
+            media_msg_ids=media_msg_ids(media_items)
         )
         await state.update_data(preview_msg_ids=preview_ids)
 
@@ -166,7 +319,8 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
         if not is_enabled():
             await c.answer("ANTHROPIC_API_KEY не задан", show_alert=True)
             return
-        await c.message.edit_reply_markup(reply_markup=rewrite_modes_kb(post_id))
+        fresh = len(parts) > 3 and parts[3] == "fresh"
+        await c.message.edit_reply_markup(reply_markup=rewrite_modes_kb(post_id, fresh=fresh))
         await c.answer()
         return
 
@@ -180,6 +334,7 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
     # ─────────────────────────────────────────────────────────────
     if action == "rw":
         mode = parts[3] if len(parts) > 3 else "std"
+        fresh = len(parts) > 4 and parts[4] == "fresh"
 
         if not is_enabled():
             await c.answer("ANTHROPIC_API_KEY не задан", show_alert=True)
@@ -204,8 +359,16 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
                         await bot.send_message(admin_id, f"❌ Пост #{post_id} не найден")
                         return
 
-                    # 2) Переписываем
-                    rewritten = await rewrite_text(post.original_text or "", mode)
+                    # 2) Переписываем (фоновый рерайт, если он ещё идёт, — дожидаемся)
+                    if not fresh:
+                        await prerewriter.wait(post_id, mode)
+                    placeholder_id = None
+                    if settings.REWRITE_STREAMING:
+                        rewritten, placeholder_id = await stream_rewrite_preview(
+                            bot, admin_id, state, post.original_text or "", mode, fresh
+                        )
+                    else:
+                        rewritten = await rewrite_text(post.original_text or "", mode, fresh=fresh)
                     rewritten = md_to_html(rewritten)
 
                     post.rewritten_text = rewritten
@@ -216,17 +379,35 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
                         select(MediaItem).where(MediaItem.post_id == post_id).order_by(MediaItem.sort_index.asc())
                     )
                     media_items = media_result.scalars().all()
-                    has_media = bool(media_items)
 
-                    # 4) Отправляем превью переписанного
-                    new_preview_ids = await send_preview_via_bot(
-                        bot,
-                        admin_id,
-                        rewritten,
-                        post.source_chat_id,
-                        post.source_message_id,
-                        has_media
-                    )
+                    # 4) Превью переписанного: текст в одно сообщение — дописываем заглушку,
+                    #    иначе (медиа/длинный текст) заменяем её полноценным превью
+                    new_preview_ids = None
+                    if placeholder_id and not media_items and len(split_html_safe(rewritten, limit=4096)) == 1:
+                        try:
+                            await bot.edit_message_text(
+                                rewritten,
+                                chat_id=admin_id,
+                                message_id=placeholder_id,
+                                parse_mode="HTML",
+                                disable_web_page_preview=True
+                            )
+                            new_preview_ids = [placeholder_id]
+                        except TelegramBadRequest as e:
+                            if "not modified" in str(e):
+                                new_preview_ids = [placeholder_id]
+
+                    if new_preview_ids is None:
+                        if placeholder_id:
+                            await safe_delete_message(bot, admin_id, placeholder_id)
+                        new_preview_ids = await send_preview_via_bot(
+                            bot,
+                            admin_id,
+                            rewritten,
+                            post.source_chat_id,
+                            post.source_message_id,
+                            media_msg_ids(media_items)
+                        )
                     await state.update_data(preview_msg_ids=new_preview_ids)
 
                     # 5) Кнопки publish/cancel
@@ -242,23 +423,22 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
                 logger.exception(f"Rewrite job error: {e}")
                 await bot.send_message(admin_id, f"❌ Ошибка: {e}")
 
-        asyncio.create_task(job())
+        if not rewrite_scheduler.submit(admin_id, post_id, job, f"{mode}:fresh" if fresh else mode):
+            await bot.send_message(admin_id, "⚠️ Очередь рерайтов переполнена, попробуйте чуть позже")
         return
 
     # ─────────────────────────────────────────────────────────────
     # УДАЛИТЬ
     # ─────────────────────────────────────────────────────────────
     if action == "delete":
+        prerewriter.cancel(post_id)
+        rewrite_scheduler.cancel_post(post_id)
         post = await db.get(Post, post_id)
         if post:
-            # 🔥 удалить превью поста
-            if post.preview_msg_ids:
-                for mid in json.loads(post.preview_msg_ids):
-                    await safe_delete_message(bot, c.from_user.id, int(mid))
-
-            # 🔥 удалить кнопки
-            if post.control_msg_id:
-                await safe_delete_message(bot, c.from_user.id, post.control_msg_id)
+            # 🔥 удалить превью поста и кнопки (у всех админов)
+            await delete_admin_messages(
+                bot, load_admin_messages(post.preview_msg_ids, post.control_msg_id, c.from_user.id)
+            )
 
             # 🔥 удалить медиа из БД
             await db.execute(delete(MediaItem).where(MediaItem.post_id == post_id))
@@ -289,7 +469,7 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
             return
 
         media_items = (await db.execute(
-            select(MediaItem).where(MediaItem.post_id == post_id)
+            select(MediaItem).where(MediaItem.post_id == post_id).order_by(MediaItem.sort_index.asc())
         )).scalars().all()
 
         # Если есть переписанный текст — используем его (уже очищен)
@@ -301,29 +481,34 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
 
         await c.answer("⏳ Публикую...")
 
-        success = await publish_post(
-            userbot.client,
-            target.chat_id,
-            text,
-            post.source_chat_id,
-            post.source_message_id,
-            bool(media_items)
-        )
+        # аккаунт, состоящий и в источнике, и в целевом канале
+        try:
+            success = await shard_pool.run([post.source_chat_id, target.chat_id], lambda client: publish_post(
+                client,
+                target.chat_id,
+                text,
+                post.source_chat_id,
+                media_msg_ids(media_items)
+            ))
+        except FloodWaitError as e:
+            # все подходящие аккаунты во FloodWait
+            await c.answer(f"⏳ FloodWait {e.seconds}с, попробуйте позже", show_alert=True)
+            return
+        except PartialPublishError as e:
+            # повторная публикация продублирует то, что уже в канале
+            await c.answer(f"⚠️ Пост {e}. Проверьте канал перед повтором", show_alert=True)
+            return
 
         if success:
             admin_id = c.from_user.id
 
-            # 1) удалить превью поста (сообщения, которые бот прислал админу)
-            if post.preview_msg_ids:
-                try:
-                    for mid in json.loads(post.preview_msg_ids):
-                        await safe_delete_message(bot, admin_id, int(mid))
-                except Exception as e:
-                    logger.error(f"Failed to delete preview msgs for post #{post_id}: {e}")
-
-            # 2) удалить сообщение с кнопками "Выберите действие" (которое создал monitor)
-            if post.control_msg_id:
-                await safe_delete_message(bot, admin_id, int(post.control_msg_id))
+            # 1-2) удалить превью поста и кнопки "Выберите действие" (которые создал monitor) у всех админов
+            try:
+                await delete_admin_messages(
+                    bot, load_admin_messages(post.preview_msg_ids, post.control_msg_id, admin_id)
+                )
+            except Exception as e:
+                logger.error(f"Failed to delete preview msgs for post #{post_id}: {e}")
 
             # 3) удалить возможные FSM-превью (переписанный вариант), если было
             await delete_preview(bot, admin_id, state)
@@ -341,6 +526,35 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
 
         return
 
+    # ─────────────────────────────────────────────────────────────
+    # В ОЧЕРЕДЬ (публикация в ближайший свободный слот)
+    # ─────────────────────────────────────────────────────────────
+    if action == "queue":
+        post = await db.get(Post, post_id)
+        if not post:
+            await c.answer("Пост не найден", show_alert=True)
+            return
+
+        target = (await db.execute(
+            select(Channel).where(Channel.role == "target", Channel.is_active == True)
+        )).scalars().first()
+
+        if not target:
+            await c.answer("Target не задан", show_alert=True)
+            return
+
+        text = (post.rewritten_text or post.original_text or "").strip()
+        slot = await publish_queue.enqueue(post_id, text, c.from_user.id)
+        if slot is None:
+            await c.answer("Пост уже в очереди", show_alert=True)
+            return
+
+        # уведомления у админов уберёт воркер после публикации — до неё пост ещё можно удалить
+        await delete_preview(bot, c.from_user.id, state)
+        await safe_delete_message(bot, c.from_user.id, c.message.message_id)
+        await c.answer(f"🕒 В очереди: {slot.astimezone(publish_tz()):%d.%m %H:%M}", show_alert=True)
+        return
+
     # ─────────────────────────────────────────────────────────────
     # ОТМЕНА (вернуться к оригиналу)
     # ─────────────────────────────────────────────────────────────
@@ -359,7 +573,7 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
 
             # Отправляем оригинал заново
             media_items = (await db.execute(
-                select(MediaItem).where(MediaItem.post_id == post_id)
+                select(MediaItem).where(MediaItem.post_id == post_id).order_by(MediaItem.sort_index.asc())
             )).scalars().all()
 
             original_preview_ids = await send_preview_via_bot(
@@ -368,7 +582,7 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
                 post.original_text or "",
                 post.source_chat_id,
                 post.source_message_id,
-                bool(media_items)
+                media_msg_ids(media_items)
             )
 
             await state.update_data(preview_msg_ids=original_preview_ids)
@@ -385,77 +599,19 @@ async def post_callbacks(c: CallbackQuery, bot: Bot, db: AsyncSession, state: FS
         return
 
 
-async def send_preview_via_bot(bot: Bot, admin_id: int, text: str, source_chat_id: int, source_message_id: int, has_media: bool) -> list[int]:
-    msg_ids: list[int] = []
-
+async def send_preview_via_bot(bot: Bot, admin_id: int, text: str, source_chat_id: int, source_message_id: int, media_msg_ids: list[int]) -> list[int]:
     try:
-        html_text = md_to_html(text)
-        caption, tail = split_caption_and_tail(html_text, caption_limit=1024)
-
-        if has_media and source_chat_id and source_message_id and userbot.client:
-            msg = await userbot.client.get_messages(source_chat_id, ids=source_message_id)
-
-            if msg and msg.grouped_id:
-                grouped_id = msg.grouped_id
-                messages = await userbot.client.get_messages(
-                    source_chat_id, limit=15, max_id=msg.id + 10, min_id=msg.id - 5
-                )
-                album_msgs = [m for m in messages if m.grouped_id == grouped_id and has_real_file(m)]
-                album_msgs.sort(key=lambda m: m.id)
-
-                if album_msgs:
-                    media_group = []
-                    for i, m in enumerate(album_msgs):
-                        file_bytes = await userbot.client.download_media(m, file=bytes)
-                        if not file_bytes:
-                            continue
-
-                        input_file = BufferedInputFile(file_bytes, filename=f"media_{i}")
-                        cap = caption if i == 0 and caption else None
-
-                        if m.photo:
-                            media_group.append(InputMediaPhoto(media=input_file, caption=cap, parse_mode="HTML"))
-                        elif m.video:
-                            media_group.append(InputMediaVideo(media=input_file, caption=cap, parse_mode="HTML"))
-                        else:
-                            media_group.append(InputMediaDocument(media=input_file, caption=cap, parse_mode="HTML"))
-
-                    if media_group:
-                        result = await bot.send_media_group(admin_id, media_group)
-                        msg_ids.extend([m.message_id for m in result])
-
-                        # хвост текста отдельными сообщениями (без ломания HTML)
-                        for chunk in split_html_safe(tail, limit=4096):
-                            m = await bot.send_message(admin_id, chunk, parse_mode="HTML", disable_web_page_preview=True)
-                            msg_ids.append(m.message_id)
-
-                        return msg_ids
-
-            elif msg and has_real_file(msg):
-                file_bytes = await userbot.client.download_media(msg, file=bytes)
-                if file_bytes:
-                    input_file = BufferedInputFile(file_bytes, filename="media")
-                    if msg.photo:
-                        res = await bot.send_photo(admin_id, input_file, caption=caption or None, parse_mode="HTML")
-                    elif msg.video:
-                        res = await bot.send_video(admin_id, input_file, caption=caption or None, parse_mode="HTML")
-                    else:
-                        res = await bot.send_document(admin_id, input_file, caption=caption or None, parse_mode="HTML")
-
-                    msg_ids.append(res.message_id)
-
-                    for chunk in split_html_safe(tail, limit=4096):
-                        m = await bot.send_message(admin_id, chunk, parse_mode="HTML", disable_web_page_preview=True)
-                        msg_ids.append(m.message_id)
-
-                    return msg_ids
-
-        # только текст
-        for chunk in split_html_safe(html_text, limit=4096):
-            m = await bot.send_message(admin_id, chunk, parse_mode="HTML", disable_web_page_preview=True)
-            msg_ids.append(m.message_id)
-
-    except Exception as e:
-        logger.error(f"Failed to send preview: {e}")
-
-    return msg_ids
\ No newline at end of file
+        return await shard_pool.run([source_chat_id], lambda client: send_preview(
+            bot, client, admin_id, text, source_chat_id, source_message_id, media_msg_ids
+        ))
+    except FloodWaitError as e:
+        # все аккаунты во FloodWait — превью по сохранённым file_id или только текст
+        logger.warning(f"Preview for admin {admin_id} without userbot: FloodWait {e.seconds}s")
+        ids = await send_preview(bot, None, admin_id, text, source_chat_id, source_message_id, media_msg_ids)
+        notice = await bot.send_message(admin_id, f"⏳ Юзербот во FloodWait ({e.seconds}с), медиа может не хватать — попробуйте позже")
+        return ids + [notice.message_id]
+
+
+def media_msg_ids(media_items: list[MediaItem]) -> list[int]:
+    """message_id медиа в источнике (хранятся в MediaItem.file_id)"""
+    return [int(m.file_id) for m in media_items]
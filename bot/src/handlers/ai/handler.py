@@ -20,10 +20,15 @@ from src.utils.ai import (
     get_prompt,
     set_prompt,
     get_all_settings,
+    reset_settings,
+    get_prompt_cache,
+    set_prompt_cache,
+    usage_stats,
     DEFAULT_MODEL,
-    DEFAULT_PROMPTS,
     AVAILABLE_MODELS,
 )
+from src.utils.rewrite_cache import rewrite_cache
+from src.utils.rewrite_scheduler import rewrite_scheduler
 
 router = Router()
 
@@ -58,7 +63,7 @@ async def set_model_handler(c: CallbackQuery):
         f"⚙️ <b>Настройки AI</b>\n\n"
         f"Текущая модель: <code>{model}</code>\n\n"
         f"Выберите действие:",
-        reply_markup=ai_settings_kb(),
+        reply_markup=ai_settings_kb(await get_prompt_cache()),
         parse_mode="HTML"
     )
 
@@ -114,7 +119,7 @@ async def save_custom_model(m: Message, state: FSMContext):
 
     await m.answer(
         f"✅ Модель установлена: <code>{model_name}</code>{warning}",
-        reply_markup=ai_settings_kb(),
+        reply_markup=ai_settings_kb(await get_prompt_cache()),
         parse_mode="HTML"
     )
 
@@ -175,7 +180,7 @@ async def save_new_prompt(m: Message, state: FSMContext):
     await m.answer(
         f"✅ Промпт <b>{MODE_NAMES.get(mode, mode)}</b> сохранён!\n\n"
         f"<pre>{_escape_html(preview)}</pre>",
-        reply_markup=ai_settings_kb(),
+        reply_markup=ai_settings_kb(await get_prompt_cache()),
         parse_mode="HTML"
     )
 
@@ -197,6 +202,27 @@ async def show_all_settings(c: CallbackQuery):
         preview = prompt
         text += f"📝 <b>{name}:</b>\n<pre>{_escape_html(preview)}</pre>\n\n"
 
+    cache = rewrite_cache.stats()
+    text += (
+        f"💾 <b>Кеш рерайтов:</b> попаданий {cache['hits_mem'] + cache['hits_db']} "
+        f"(память {cache['hits_mem']} / БД {cache['hits_db']}), промахов {cache['misses']}\n"
+    )
+
+    usage = usage_stats()
+    text += (
+        f"🧊 <b>Кеш промпта:</b> {'вкл' if await get_prompt_cache() else 'выкл'}, "
+        f"запросов {usage['requests']}, токенов на входе {usage['input_tokens']}, "
+        f"из кеша {usage['cache_read_input_tokens']}, записано в кеш {usage['cache_creation_input_tokens']}\n"
+    )
+
+    jobs = rewrite_scheduler.stats()
+    text += (
+        f"⏱ <b>Очередь рерайтов:</b> в очереди {jobs['queue']}, выполнено {jobs['completed']}, "
+        f"ошибок {jobs['failed']}, отменено {jobs['cancelled']}, "
+        f"ожидание ср. {jobs['wait_avg']:.1f}с / макс. {jobs['wait_max']:.1f}с, "
+        f"выполнение ср. {jobs['run_avg']:.1f}с\n"
+    )
+
     await c.message.edit_text(
         text,
         reply_markup=back_to_ai_settings_kb(),
@@ -205,6 +231,20 @@ async def show_all_settings(c: CallbackQuery):
     await c.answer()
 
 
+# ─────────────────────────────────────────────────────────────
+# Кеширование промпта
+# ─────────────────────────────────────────────────────────────
+
+@router.callback_query(F.data == "ai:toggle_prompt_cache")
+async def toggle_prompt_cache(c: CallbackQuery):
+    """Вкл/выкл cache_control для системного промпта"""
+    enabled = not await get_prompt_cache()
+    await set_prompt_cache(enabled)
+
+    await c.message.edit_reply_markup(reply_markup=ai_settings_kb(enabled))
+    await c.answer("🧊 Кеш промпта включён" if enabled else "🧊 Кеш промпта выключен")
+
+
 # ─────────────────────────────────────────────────────────────
 # Сброс настроек
 # ─────────────────────────────────────────────────────────────
@@ -226,10 +266,7 @@ async def confirm_reset(c: CallbackQuery):
 @router.callback_query(F.data == "ai:confirm_reset")
 async def do_reset(c: CallbackQuery):
     """Выполнить сброс настроек"""
-    await set_model(DEFAULT_MODEL)
-
-    for mode, prompt in DEFAULT_PROMPTS.items():
-        await set_prompt(mode, prompt)
+    await reset_settings()
 
     await c.answer("✅ Настройки сброшены!", show_alert=True)
 
@@ -237,7 +274,7 @@ async def do_reset(c: CallbackQuery):
         f"⚙️ <b>Настройки AI</b>\n\n"
         f"Текущая модель: <code>{DEFAULT_MODEL}</code>\n\n"
         f"Все настройки сброшены.",
-        reply_markup=ai_settings_kb(),
+        reply_markup=ai_settings_kb(await get_prompt_cache()),
         parse_mode="HTML"
     )
 
@@ -256,7 +293,7 @@ async def back_to_ai_settings(c: CallbackQuery, state: FSMContext):
         f"⚙️ <b>Настройки AI</b>\n\n"
         f"Текущая модель: <code>{model}</code>\n\n"
         f"Выберите действие:",
-        reply_markup=ai_settings_kb(),
+        reply_markup=ai_settings_kb(await get_prompt_cache()),
         parse_mode="HTML"
     )
     await c.answer()
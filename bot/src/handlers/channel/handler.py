@@ -17,6 +17,7 @@ from src.keyboards.inline import admin_menu_kb
 from src.models.channel import Channel
 from src.states.admin_states import AdminStates
 from src.userbot.client import userbot
+from src.userbot.sources import source_registry
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -116,8 +117,7 @@ async def add_source_process(m: Message, state: FSMContext, db: AsyncSession):
     db.add(channel)
     await db.commit()
 
-    # Сбрасываем кеш
-    userbot.invalidate_cache()
+    await source_registry.update(channel)
 
     await m.answer(
         f"✅ Источник добавлен!\n\n"
@@ -139,13 +139,9 @@ async def view_source(c: CallbackQuery, db: AsyncSession):
         await c.answer("Канал не найден", show_alert=True)
         return
 
-    status = "✅ Активен" if channel.is_active else "⏸ Приостановлен"
-
     await c.message.edit_text(
-        f"📡 <b>{channel.title}</b>\n\n"
-        f"ID: <code>{channel.chat_id}</code>\n"
-        f"Статус: {status}",
-        reply_markup=source_actions_kb(channel.id, channel.is_active),
+        _source_card(channel),
+        reply_markup=source_actions_kb(channel.id, channel.is_active, channel.prerewrite),
         parse_mode="HTML"
     )
     await c.answer()
@@ -164,19 +160,39 @@ async def toggle_source(c: CallbackQuery, db: AsyncSession):
     channel.is_active = not channel.is_active
     await db.commit()
 
-    userbot.invalidate_cache()
+    await source_registry.update(channel)
 
-    status = "✅ Активен" if channel.is_active else "⏸ Приостановлен"
     await c.message.edit_text(
-        f"📡 <b>{channel.title}</b>\n\n"
-        f"ID: <code>{channel.chat_id}</code>\n"
-        f"Статус: {status}",
-        reply_markup=source_actions_kb(channel.id, channel.is_active),
+        _source_card(channel),
+        reply_markup=source_actions_kb(channel.id, channel.is_active, channel.prerewrite),
         parse_mode="HTML"
     )
     await c.answer("Статус изменён")
 
 
+@router.callback_query(F.data.startswith("src:prerewrite:"))
+async def toggle_prerewrite(c: CallbackQuery, db: AsyncSession):
+    """Вкл/выкл фоновый рерайт для источника"""
+    channel_id = int(c.data.split(":")[2])
+
+    channel = await db.get(Channel, channel_id)
+    if not channel:
+        await c.answer("Канал не найден", show_alert=True)
+        return
+
+    channel.prerewrite = not channel.prerewrite
+    await db.commit()
+
+    await source_registry.update(channel)
+
+    await c.message.edit_text(
+        _source_card(channel),
+        reply_markup=source_actions_kb(channel.id, channel.is_active, channel.prerewrite),
+        parse_mode="HTML"
+    )
+    await c.answer("Фоновый рерайт включён" if channel.prerewrite else "Фоновый рерайт выключен")
+
+
 @router.callback_query(F.data.startswith("src:delete:"))
 async def delete_source(c: CallbackQuery, db: AsyncSession):
     """Удалить источник"""
@@ -186,7 +202,7 @@ async def delete_source(c: CallbackQuery, db: AsyncSession):
     if channel:
         await db.delete(channel)
         await db.commit()
-        userbot.invalidate_cache()
+        await source_registry.remove(channel.chat_id)
 
     await c.message.edit_text(
         "🗑 Источник удалён",
@@ -215,4 +231,15 @@ async def back_to_main(c: CallbackQuery):
         reply_markup=admin_menu_kb(),
         parse_mode="HTML"
     )
-    await c.answer()
\ No newline at end of file
+    await c.answer()
+
+
+def _source_card(channel: Channel) -> str:
+    status = "✅ Активен" if channel.is_active else "⏸ Приостановлен"
+    prerewrite = "вкл" if channel.prerewrite else "выкл"
+    return (
+        f"📡 <b>{channel.title}</b>\n\n"
+        f"ID: <code>{channel.chat_id}</code>\n"
+        f"Статус: {status}\n"
+        f"Фоновый рерайт: {prerewrite}"
+    )
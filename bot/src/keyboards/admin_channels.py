@@ -26,12 +26,14 @@ def sources_list_kb(sources: list) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
-def source_actions_kb(channel_id: int, is_active: bool) -> InlineKeyboardMarkup:
+def source_actions_kb(channel_id: int, is_active: bool, prerewrite: bool = False) -> InlineKeyboardMarkup:
     """Действия с источником"""
     toggle_text = "⏸ Приостановить" if is_active else "▶️ Включить"
+    prerewrite_text = "⚡ Фоновый рерайт: вкл" if prerewrite else "⚡ Фоновый рерайт: выкл"
 
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=toggle_text, callback_data=f"src:toggle:{channel_id}")],
+        [InlineKeyboardButton(text=prerewrite_text, callback_data=f"src:prerewrite:{channel_id}")],
         [InlineKeyboardButton(text="🗑 Удалить", callback_data=f"src:delete:{channel_id}")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data="src:list")],
     ])
@@ -8,13 +8,15 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from src.utils.ai import AVAILABLE_MODELS
 
 
-def ai_settings_kb() -> InlineKeyboardMarkup:
+def ai_settings_kb(prompt_cache: bool = False) -> InlineKeyboardMarkup:
     """Меню настроек AI"""
+    cache_text = "🧊 Кеш промпта: вкл" if prompt_cache else "🧊 Кеш промпта: выкл"
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🤖 Изменить модель", callback_data="ai:select_model")],
         [InlineKeyboardButton(text="📝 Промпт (стандартный)", callback_data="ai:edit_prompt:std")],
         [InlineKeyboardButton(text="✂️ Промпт (короткий)", callback_data="ai:edit_prompt:short")],
         [InlineKeyboardButton(text="🎨 Промпт (креативный)", callback_data="ai:edit_prompt:creative")],
+        [InlineKeyboardButton(text=cache_text, callback_data="ai:toggle_prompt_cache")],
         [InlineKeyboardButton(text="📊 Показать все настройки", callback_data="ai:show_settings")],
         [InlineKeyboardButton(text="🔄 Сбросить на дефолт", callback_data="ai:reset")],
         [InlineKeyboardButton(text="◀️ Назад в меню", callback_data="ai:back_to_admin")],
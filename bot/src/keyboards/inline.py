@@ -16,15 +16,18 @@ def admin_menu_kb() -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="🎯 Целевой канал", callback_data="adm:set_target")],
         [InlineKeyboardButton(text="🔌 Подключения", callback_data="adm:list_links")],
         [InlineKeyboardButton(text="⚙️ Настройки AI", callback_data="adm:ai_settings")],
+        [InlineKeyboardButton(text="📦 Рерайт бэклога", callback_data="adm:backlog")],
+        [InlineKeyboardButton(text="🗓 Очередь публикаций", callback_data="adm:publish_queue")],
     ])
 
 
-def rewrite_modes_kb(post_id: int) -> InlineKeyboardMarkup:
-    """Выбор режима переписывания"""
+def rewrite_modes_kb(post_id: int, fresh: bool = False) -> InlineKeyboardMarkup:
+    """Выбор режима переписывания (fresh — мимо кеша рерайтов)"""
+    suffix = ":fresh" if fresh else ""
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📝 Стандартный", callback_data=f"p:{post_id}:rw:std")],
-        [InlineKeyboardButton(text="✂️ Короткий", callback_data=f"p:{post_id}:rw:short")],
-        [InlineKeyboardButton(text="🎨 Креативный", callback_data=f"p:{post_id}:rw:creative")],
+        [InlineKeyboardButton(text="📝 Стандартный", callback_data=f"p:{post_id}:rw:std{suffix}")],
+        [InlineKeyboardButton(text="✂️ Короткий", callback_data=f"p:{post_id}:rw:short{suffix}")],
+        [InlineKeyboardButton(text="🎨 Креативный", callback_data=f"p:{post_id}:rw:creative{suffix}")],
         [InlineKeyboardButton(text="◀️ Назад", callback_data=f"p:{post_id}:back")],
     ])
 
@@ -44,9 +47,10 @@ def preview_actions_kb(post_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
         [
             InlineKeyboardButton(text="📤 Опубликовать", callback_data=f"p:{post_id}:publish"),
-            InlineKeyboardButton(text="❌ Отмена", callback_data=f"p:{post_id}:cancel"),
+            InlineKeyboardButton(text="🕒 В очередь", callback_data=f"p:{post_id}:queue"),
         ],
-        [InlineKeyboardButton(text="🔄 Переписать ещё", callback_data=f"p:{post_id}:rewrite")],
+        [InlineKeyboardButton(text="❌ Отмена", callback_data=f"p:{post_id}:cancel")],
+        [InlineKeyboardButton(text="🔄 Переписать ещё", callback_data=f"p:{post_id}:rewrite:fresh")],
     ])
 
 
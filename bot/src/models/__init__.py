@@ -4,5 +4,9 @@ from src.models.channel import Channel
 from src.models.post import Post
 from src.models.media_item import MediaItem
 from src.models.ai_settings import AISettings
+from src.models.rewrite_cache import RewriteCacheEntry
+from src.models.ingest_spill import IngestSpill
+from src.models.notification_outbox import OutboxMessage
+from src.models.publish_queue import ScheduledPost
 
-__all__ = ["Base", "Channel", "Post", "MediaItem", "AISettings"]
\ No newline at end of file
+__all__ = ["Base", "Channel", "Post", "MediaItem", "AISettings", "RewriteCacheEntry", "IngestSpill", "OutboxMessage", "ScheduledPost"]
\ No newline at end of file
@@ -11,4 +11,6 @@ class Channel(Base):
     chat_id: Mapped[int] = mapped_column(BigInteger, unique=True, index=True)
     role: Mapped[str] = mapped_column(String(16), index=True)  # "source" | "target"
     title: Mapped[str] = mapped_column(String(255), default="")
-    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
\ No newline at end of file
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True)
+    last_message_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)  # последний принятый пост — догон после простоя
+    prerewrite: Mapped[bool] = mapped_column(Boolean, default=False, server_default="false")  # фоновый рерайт при поступлении
\ No newline at end of file
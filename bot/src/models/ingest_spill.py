@@ -0,0 +1,18 @@
+from sqlalchemy import BigInteger, Integer, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.utils.db import Base
+
+
+class IngestSpill(Base):
+    """Сообщения, не поместившиеся в очередь приёма (INGEST_OVERFLOW=spill); дочитываются по порядку id"""
+    __tablename__ = "ingest_spill"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+
+    chat_id: Mapped[int] = mapped_column(BigInteger)  # формат бота: -100...
+    message_id: Mapped[int] = mapped_column(Integer)
+
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
@@ -10,8 +10,9 @@ class MediaItem(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     post_id: Mapped[int] = mapped_column(ForeignKey("posts.id", ondelete="CASCADE"), index=True)
 
-    kind: Mapped[str] = mapped_column(String(24))  # photo/video/document/animation/...
-    file_id: Mapped[str] = mapped_column(String(512))
+    kind: Mapped[str] = mapped_column(String(24))  # photo/video/document/animation/... ("media" до первой загрузки)
+    file_id: Mapped[str] = mapped_column(String(512))  # message_id в канале-источнике
+    bot_file_id: Mapped[str | None] = mapped_column(String(256), nullable=True)  # file_id в Bot API после первой загрузки
 
     sort_index: Mapped[int] = mapped_column(Integer, default=0)
 
@@ -6,6 +6,7 @@ from sqlalchemy import (
     BigInteger,
     DateTime,
     func,
+    Index,
     UniqueConstraint,
 )
 
@@ -27,10 +28,10 @@ class Post(Base):
     notified: Mapped[int] = mapped_column(Integer, default=0)
 
     preview_msg_ids: Mapped[str | None] = mapped_column(
-        Text, nullable=True, comment="JSON list of preview message_ids sent to admins"
+        Text, nullable=True, comment='JSON {"admin_id": [preview and control message_ids]} sent to admins'
     )
     control_msg_id: Mapped[int | None] = mapped_column(
-        BigInteger, nullable=True, comment="Message ID with inline buttons"
+        BigInteger, nullable=True, comment="Legacy: message ID with inline buttons (old list format only)"
     )
 
     created_at: Mapped[DateTime] = mapped_column(
@@ -50,4 +51,6 @@ class Post(Base):
             name="uq_post_group",
             sqlite_on_conflict="IGNORE",
         ),
+        # одиночные посты: media_group_id у них NULL, uq_post_group их не ловит
+        Index("uq_post_source_message", "source_chat_id", "source_message_id", unique=True),
     )
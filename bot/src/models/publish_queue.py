@@ -0,0 +1,32 @@
+from sqlalchemy import BigInteger, DateTime, ForeignKey, Index, Integer, String, Text, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.utils.db import Base
+
+
+class ScheduledPost(Base):
+    """Одобренный пост в очереди на публикацию в свой слот"""
+    __tablename__ = "publish_queue"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+
+    # после публикации пост удаляется, строка остаётся — по ней считается MIN_GAP после рестарта
+    post_id: Mapped[int | None] = mapped_column(
+        ForeignKey("posts.id", ondelete="SET NULL"), unique=True, nullable=True
+    )
+    text: Mapped[str] = mapped_column(Text, default="")  # текст, который одобрил админ
+    queued_by: Mapped[int] = mapped_column(BigInteger)
+
+    status: Mapped[str] = mapped_column(String(16), default="pending")  # pending | done | failed | cancelled
+    slot_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True))
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    published_at: Mapped[DateTime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_publish_queue_due", "status", "slot_at"),
+    )
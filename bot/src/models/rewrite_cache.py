@@ -0,0 +1,21 @@
+from sqlalchemy import String, Text, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.utils.db import Base
+
+
+class RewriteCacheEntry(Base):
+    __tablename__ = "rewrite_cache"
+
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
+
+    # sha256(model | sha256(prompt) | mode | sha256(normalized text))
+    cache_key: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    model: Mapped[str] = mapped_column(String(100))
+    mode: Mapped[str] = mapped_column(String(16))
+
+    rewritten_text: Mapped[str] = mapped_column(Text)
+
+    created_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
@@ -0,0 +1,159 @@
+"""
+src/userbot/album.py
+Сборка альбомов: части одного grouped_id копятся, пока не перестанут приходить.
+Ожидание — по наблюдаемым интервалам между частями у источника (EWMA),
+все дедлайны на одном таймере.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+FlushCallback = Callable[[str], Awaitable[None]]
+
+# Вес нового интервала в EWMA
+GAP_ALPHA = 0.3
+# Границы корзин гистограммы задержки сборки, секунды
+LATENCY_BUCKETS = (0.5, 1.0, 2.0, 3.0, 5.0)
+# Сколько недавно собранных альбомов помнить, чтобы заметить опоздавшие части
+RECENT_SIZE = 256
+
+
+@dataclass
+class _Album:
+    source_id: int
+    first_at: float
+    last_at: float
+    deadline: float
+    parts: int = 1
+
+
+class AlbumAssembler:
+    """Дедлайн альбома сдвигается с каждой частью, но не дальше ALBUM_WAIT_HARD_CAP от первой"""
+
+    def __init__(self, on_flush: FlushCallback):
+        self._on_flush = on_flush
+        self._pending: dict[str, _Album] = {}
+        self._recent: OrderedDict[str, _Album] = OrderedDict()
+        self._gaps: dict[int, float] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._timer: asyncio.Task | None = None
+        self._flushing: set[asyncio.Task] = set()
+
+        self.flushed = 0
+        self.capped = 0
+        self.late_parts = 0
+        self._latency_total = 0.0
+        self._latency_hist = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def _observe_gap(self, source_id: int, gap: float):
+        prev = self._gaps.get(source_id)
+        self._gaps[source_id] = gap if prev is None else prev + GAP_ALPHA * (gap - prev)
+
+    def _wait(self, source_id: int) -> float:
+        gap = self._gaps.get(source_id)
+        if gap is None:
+            return settings.ALBUM_WAIT_MAX
+        return min(max(gap * settings.ALBUM_WAIT_FACTOR, settings.ALBUM_WAIT_MIN), settings.ALBUM_WAIT_MAX)
+
+    def add(self, key: str, source_id: int):
+        """Пришла часть альбома key"""
+        now = time.monotonic()
+        album = self._pending.get(key)
+
+        if album is None:
+            late = self._recent.pop(key, None)
+            if late is not None:
+                # альбом уже сохранён без этой части — в следующий раз ждём дольше
+                self.late_parts += 1
+                self._observe_gap(source_id, now - late.last_at)
+                logger.warning(f"Late album part for {key}: {now - late.last_at:.2f}s after previous")
+
+            album = self._pending[key] = _Album(source_id, first_at=now, last_at=now, deadline=now)
+        else:
+            self._observe_gap(source_id, now - album.last_at)
+            album.parts += 1
+            album.last_at = now
+
+        album.deadline = min(now + self._wait(source_id), album.first_at + settings.ALBUM_WAIT_HARD_CAP)
+
+        seq = next(self._seq)
+        heapq.heappush(self._heap, (album.deadline, seq, key))
+
+        if self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._run())
+        elif self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                deadline, _, key = heapq.heappop(self._heap)
+                album = self._pending.get(key)
+                # устаревшие записи кучи (дедлайн сдвинулся) пропускаем
+                if album is not None and album.deadline == deadline:
+                    self._flush(key, now)
+
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _flush(self, key: str, now: float):
+        album = self._pending.pop(key)
+
+        self._recent[key] = album
+        while len(self._recent) > RECENT_SIZE:
+            self._recent.popitem(last=False)
+
+        latency = now - album.first_at
+        self.flushed += 1
+        self._latency_total += latency
+        self._latency_hist[sum(1 for bound in LATENCY_BUCKETS if latency > bound)] += 1
+        if album.deadline >= album.first_at + settings.ALBUM_WAIT_HARD_CAP:
+            self.capped += 1
+
+        logger.info(f"🧩 Album {key} assembled: {album.parts} parts in {latency:.2f}s")
+
+        task = asyncio.create_task(self._on_flush(key))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def stop(self):
+        """Сохранить всё недособранное и дождаться сохранения"""
+        if self._timer:
+            self._timer.cancel()
+            await asyncio.gather(self._timer, return_exceptions=True)
+            self._timer = None
+
+        now = time.monotonic()
+        for key in list(self._pending):
+            self._flush(key, now)
+        self._heap.clear()
+
+        await asyncio.gather(*self._flushing, return_exceptions=True)
+
+    def stats(self) -> dict:
+        labels = [f"≤{bound:g}с" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]:g}с"]
+        return {
+            "pending": len(self._pending),
+            "flushed": self.flushed,
+            "capped": self.capped,
+            "late_parts": self.late_parts,
+            "latency_avg": self._latency_total / self.flushed if self.flushed else 0.0,
+            "latency_hist": dict(zip(labels, self._latency_hist)),
+        }
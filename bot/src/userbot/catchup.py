@@ -0,0 +1,146 @@
+"""
+src/userbot/catchup.py
+Догон постов, опубликованных в источниках, пока юзербот был выключен или без связи:
+всё новее Channel.last_message_id пачкой через iter_messages(min_id=...),
+аккаунтом-владельцем источника, дальше — обычный путь приёма (сборка альбомов, запись с дедупом, уведомления).
+"""
+
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select
+from telethon.errors import FloodWaitError
+from telethon.tl import types
+
+from src.models.media_item import MediaItem
+from src.models.post import Post
+from src.userbot.message_cache import message_cache
+from src.userbot.monitor import monitor
+from src.userbot.shards import shard_pool
+from src.userbot.sources import Source, source_registry
+from src.utils.config import settings
+from src.utils.db import session
+
+logger = logging.getLogger(__name__)
+
+
+async def _known_message_ids(chat_id: int, min_id: int) -> set[int]:
+    """message_id источника новее min_id, которые уже есть в posts/media_items"""
+    async with session() as s:
+        rows = (await s.execute(
+            select(Post.source_message_id, MediaItem.file_id)
+            .outerjoin(MediaItem, MediaItem.post_id == Post.id)
+            .where(Post.source_chat_id == chat_id, Post.source_message_id > min_id)
+        )).all()
+
+    known = set()
+    for source_message_id, file_id in rows:
+        known.add(source_message_id)
+        if file_id:
+            known.add(int(file_id))
+    return known
+
+
+class CatchUp:
+    def __init__(self):
+        self._lock = asyncio.Lock()
+
+        self.runs = 0
+        self.last_recovered = 0
+        self.last_duration = 0.0
+        self.total_recovered = 0
+
+    async def _catch_up_source(self, source: Source) -> int:
+        """Догнать один источник его аккаунтом. Возвращает число восстановленных постов (альбом — один пост)"""
+        client = shard_pool.owner_client(source.chat_id)
+        if client is None:
+            return 0
+
+        if source.last_message_id is None:
+            # первый запуск с отметками — историю не тянем, просто запоминаем верх
+            latest = await client.get_messages(source.chat_id, limit=1)
+            if latest:
+                source_registry.mark_seen(source, latest[0].id)
+            return 0
+
+        min_id = source.last_message_id
+        messages = [
+            m async for m in client.iter_messages(
+                source.chat_id, min_id=min_id, reverse=True, limit=settings.CATCHUP_MAX_MESSAGES
+            )
+            if isinstance(m, types.Message)
+        ]
+        if not messages:
+            return 0
+
+        known = await _known_message_ids(source.chat_id, min_id)
+        chat = await client.get_entity(source.chat_id)
+
+        posts = set()
+        for message in messages:
+            # уже сохранён
+            if message.id in known:
+                source_registry.mark_seen(source, message.id)
+                continue
+            # только что пришёл живым апдейтом — отметку сдвинет его запись
+            if message_cache.get(source.chat_id, message.id) is not None:
+                continue
+            # по порядку, как пришли бы живые апдейты: альбомы собирает AlbumAssembler
+            await monitor.on_message(chat, message)
+            posts.add(message.grouped_id or ("single", message.id))
+
+        if len(messages) >= settings.CATCHUP_MAX_MESSAGES:
+            logger.warning(f"Catch-up for {source.title} hit the limit of {settings.CATCHUP_MAX_MESSAGES} messages")
+
+        return len(posts)
+
+    async def run(self, chat_ids: list[int] | None = None) -> int:
+        """Догнать активные источники (все или chat_ids), не больше CATCHUP_CONCURRENCY одновременно"""
+        if not settings.CATCHUP_ENABLED:
+            return 0
+
+        sources = source_registry.all() if chat_ids is None else [
+            source for chat_id in chat_ids if (source := source_registry.get(chat_id))
+        ]
+
+        async with self._lock:
+            started = time.perf_counter()
+            semaphore = asyncio.Semaphore(max(1, settings.CATCHUP_CONCURRENCY))
+
+            async def one(source: Source) -> int:
+                async with semaphore:
+                    try:
+                        return await self._catch_up_source(source)
+                    except FloodWaitError as e:
+                        # источник переедет на другой аккаунт, догон продолжится там
+                        shard = shard_pool.owner(source.chat_id)
+                        if shard:
+                            shard_pool.mark_flood(shard, e.seconds)
+                        return 0
+                    except Exception as e:
+                        logger.exception(f"Catch-up failed for {source.title} ({source.chat_id}): {e}")
+                        return 0
+
+            recovered = sum(await asyncio.gather(*(one(source) for source in sources)))
+            await source_registry.flush()
+
+            self.runs += 1
+            self.last_recovered = recovered
+            self.last_duration = time.perf_counter() - started
+            self.total_recovered += recovered
+
+            logger.info(f"🔁 Catch-up: recovered {recovered} posts in {self.last_duration:.1f}s")
+            return recovered
+
+    def stats(self) -> dict:
+        return {
+            "runs": self.runs,
+            "last_recovered": self.last_recovered,
+            "last_duration": self.last_duration,
+            "total_recovered": self.total_recovered,
+        }
+
+
+# Глобальный экземпляр
+catch_up = CatchUp()
@@ -3,6 +3,7 @@ src/userbot/client.py
 Telethon клиент — подключение и базовые методы
 """
 
+import asyncio
 import logging
 import re
 
@@ -19,71 +20,106 @@ from telethon.errors import (
 )
 
 from src.utils.config import settings
+from src.userbot.catchup import catch_up
+from src.userbot.ingest_queue import ingest_queue
 from src.userbot.monitor import monitor
+from src.userbot.outbox import notification_outbox
+from src.userbot.publish_queue import publish_queue
+from src.userbot.shards import shard_pool
+from src.userbot.sources import source_registry
 
 logger = logging.getLogger(__name__)
 
 
 class UserBot:
-    """Telethon клиент для юзербота"""
+    """Telethon-клиенты юзербота: основной аккаунт + USERBOT_ACCOUNTS (см. shards.py)"""
 
     def __init__(self):
-        self.client: TelegramClient | None = None
+        self._tasks: set[asyncio.Task] = set()
+        shard_pool.on_reassign(self._on_reassign)
+
+    @property
+    def client(self) -> TelegramClient | None:
+        """Основной аккаунт — вступление в каналы, поиск сущностей"""
+        return shard_pool.primary.client if shard_pool.primary else None
 
     def set_bot(self, bot: Bot):
         """Передать aiogram бота для уведомлений"""
         monitor.set_bot(bot)
+        publish_queue.set_bot(bot)
 
     async def start(self):
         """Запуск юзербота"""
-        self.client = TelegramClient(
-            'userbot_session',
-            settings.API_ID,
-            settings.API_HASH
-        )
+        await shard_pool.start()
 
-        await self.client.start(phone=settings.PHONE)
+        logger.info(f"Userbot connected: {len(shard_pool.shards)} accounts")
 
-        logger.info("Userbot connected")
-
-        monitor.set_client(self.client)
-        self.client.add_event_handler(
-            self._on_new_message,
-            events.NewMessage()
-        )
+        await ingest_queue.start()
+        notification_outbox.start()
+        publish_queue.start()
+        self._register_handlers()
 
         logger.info("Userbot handlers registered")
 
+        # посты, вышедшие, пока юзербот был выключен; дальше — после переподключений и переездов
+        await catch_up.run()
+
+    def _register_handlers(self):
+        """
+        Каждый аккаунт слушает только свои источники: Telethon отсеивает
+        остальной трафик по chat_id, до get_chat и любых запросов.
+        """
+        for shard in shard_pool.shards:
+            chat_ids = shard_pool.owned_chats(shard)
+            shard.client.remove_event_handler(self._on_new_message)
+            shard.client.add_event_handler(
+                self._on_new_message,
+                events.NewMessage(chats=chat_ids)
+            )
+            logger.info(f"Account {shard.name}: message handler filtered to {len(chat_ids)} source chats")
+
+    def _on_reassign(self, catch_up_chats: list[int]):
+        self._register_handlers()
+        if catch_up_chats:
+            task = asyncio.create_task(catch_up.run(catch_up_chats))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
     async def stop(self):
         """Остановка"""
-        if self.client:
-            await self.client.disconnect()
-            logger.info("Userbot disconnected")
+        # очередь приёма и альбомы в буфере дорабатываем, пока клиенты ещё подключены
+        await ingest_queue.stop()
+        await monitor.stop()
+        await notification_outbox.stop()
+        await publish_queue.stop()
+        await shard_pool.stop()
 
     async def run_until_disconnected(self):
-        """Держим соединение"""
+        """Держим соединение (остальные аккаунты работают в том же цикле событий)"""
         if self.client:
             await self.client.run_until_disconnected()
 
     async def _on_new_message(self, event: events.NewMessage.Event):
-        """Обработчик новых сообщений"""
+        """Обработчик новых сообщений: только в очередь, обработка — воркерами"""
         try:
-            chat = await event.get_chat()
-            if isinstance(chat, TelethonChannel):
-                await monitor.on_message(chat, event.message)
+            if source_registry.get(event.chat_id) is None:
+                return
+
+            await ingest_queue.put(event.message)
         except Exception as e:
             logger.exception(f"Error handling message: {e}")
 
-    async def get_channel_info(self, identifier: str) -> dict | None:
+    async def get_channel_info(self, identifier: str, client: TelegramClient | None = None) -> dict | None:
         """Получить информацию о канале (публичном или уже подписанном)"""
-        if not self.client:
+        client = client or self.client
+        if not client:
             return None
 
         try:
             clean = self._clean_identifier(identifier)
             logger.info(f"Getting channel info: {clean}")
 
-            entity = await self.client.get_entity(clean)
+            entity = await client.get_entity(clean)
 
             if isinstance(entity, TelethonChannel):
                 return {
@@ -99,14 +135,33 @@ class UserBot:
 
     async def join_channel(self, invite_link: str) -> dict | None:
         """
-        Вступить в канал по ссылке.
+        Вступить в канал по ссылке основным аккаунтом и ещё SHARD_JOIN_REPLICAS-1
+        аккаунтами по кольцу — им источник достанется при FloodWait/обрыве основного.
         """
-        if not self.client:
+        primary = shard_pool.primary
+        if not primary:
             logger.error("Client not initialized")
             return None
 
         logger.info(f"join_channel called with: {invite_link}")
 
+        info = await self._join(primary.client, invite_link)
+        if not info:
+            return None
+        primary.chats.add(info["chat_id"])
+
+        replicas = [
+            shard for shard in shard_pool.ring_order(info["chat_id"]) if shard is not primary
+        ][:max(0, settings.SHARD_JOIN_REPLICAS - 1)]
+
+        async def join_replica(shard) -> None:
+            if await self._join(shard.client, invite_link):
+                shard.chats.add(info["chat_id"])
+
+        await asyncio.gather(*(join_replica(shard) for shard in replicas))
+        return info
+
+    async def _join(self, client: TelegramClient, invite_link: str) -> dict | None:
         try:
             # Извлекаем hash для приватных ссылок
             invite_hash = self._extract_invite_hash(invite_link)
@@ -114,12 +169,12 @@ class UserBot:
             if invite_hash:
                 # Приватная ссылка
                 logger.info(f"Private link detected, hash: {invite_hash}")
-                return await self._join_private(invite_hash)
+                return await self._join_private(client, invite_hash)
             else:
                 # Публичный канал
                 username = self._clean_identifier(invite_link)
                 logger.info(f"Public channel detected: {username}")
-                return await self._join_public(username)
+                return await self._join_public(client, username)
 
         except Exception as e:
             logger.exception(f"join_channel failed: {e}")
@@ -154,11 +209,11 @@ class UserBot:
 
         return link
 
-    async def _join_private(self, invite_hash: str) -> dict | None:
+    async def _join_private(self, client: TelegramClient, invite_hash: str) -> dict | None:
         """Вступить в приватный канал"""
         try:
             logger.info(f"Calling ImportChatInviteRequest({invite_hash})")
-            result = await self.client(ImportChatInviteRequest(invite_hash))
+            result = await client(ImportChatInviteRequest(invite_hash))
 
             chat = result.chats[0]
             logger.info(f"Joined private channel: {chat.title}")
@@ -172,7 +227,7 @@ class UserBot:
             logger.info("Already a participant, trying to get entity...")
             try:
                 # Пробуем получить через hash
-                entity = await self.client.get_entity(f"https://t.me/+{invite_hash}")
+                entity = await client.get_entity(f"https://t.me/+{invite_hash}")
                 if isinstance(entity, TelethonChannel):
                     return {
                         "chat_id": -int(f"100{entity.id}"),
@@ -194,11 +249,11 @@ class UserBot:
             logger.exception(f"_join_private failed: {e}")
             return None
 
-    async def _join_public(self, username: str) -> dict | None:
+    async def _join_public(self, client: TelegramClient, username: str) -> dict | None:
         """Вступить в публичный канал"""
         try:
             logger.info(f"Calling JoinChannelRequest({username})")
-            result = await self.client(JoinChannelRequest(username))
+            result = await client(JoinChannelRequest(username))
 
             chat = result.chats[0]
             logger.info(f"Joined public channel: {chat.title}")
@@ -210,19 +265,15 @@ class UserBot:
 
         except UserAlreadyParticipantError:
             logger.info("Already a participant")
-            return await self.get_channel_info(username)
+            return await self.get_channel_info(username, client)
 
         except Exception as e:
             logger.exception(f"_join_public failed: {e}")
             return None
 
-    def invalidate_cache(self):
-        """Сбросить кеш источников"""
-        monitor.invalidate_cache()
-
     @property
     def is_connected(self) -> bool:
-        return self.client is not None and self.client.is_connected()
+        return any(shard.client.is_connected() for shard in shard_pool.shards)
 
 
 # Глобальный экземпляр
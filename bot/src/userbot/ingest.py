@@ -0,0 +1,269 @@
+"""
+src/userbot/ingest.py
+Групповая запись новых постов: посты за короткое окно — одна транзакция,
+многострочный INSERT ... ON CONFLICT DO NOTHING RETURNING для posts, один INSERT для media_items
+и один — для строк notification_outbox (уведомление не теряется между записью поста и постановкой в outbox).
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from src.models.media_item import MediaItem
+from src.models.notification_outbox import OutboxMessage
+from src.models.post import Post
+from src.userbot.outbox import notification_outbox
+from src.utils.config import settings
+from src.utils.db import session
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _PendingPost:
+    source_chat_id: int
+    source_message_id: int
+    media_group_id: str | None
+    text: str
+    media_msg_ids: list[int]
+    future: asyncio.Future = field(repr=False)
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return self.source_chat_id, self.source_message_id
+
+
+class IngestWriter:
+    """
+    save() ждёт коммита своей пачки и возвращает id поста
+    (None — дубль: альбом по uq_post_group, одиночный пост по uq_post_source_message)
+    """
+
+    def __init__(self):
+        self._queue: asyncio.Queue[_PendingPost | None] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+
+        self.batches = 0
+        self.batched = 0
+        self.posts = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.retried = 0  # пачек, переписанных по одному посту после ошибки
+        self.batch_max = 0
+        self.last_batch = 0
+        self.last_commit = 0.0
+        self._commit_total = 0.0
+
+    async def save(
+            self,
+            source_chat_id: int,
+            source_message_id: int,
+            media_group_id: str | None,
+            text: str,
+            media_msg_ids: list[int]
+    ) -> int | None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_PendingPost(
+            source_chat_id, source_message_id, media_group_id, text or "", sorted(media_msg_ids), future
+        ))
+        return await future
+
+    async def _collect(self) -> tuple[list[_PendingPost], bool]:
+        """
+        Первый пост + всё, что успело прийти за INGEST_BATCH_WINDOW (не больше INGEST_BATCH_MAX).
+        Второе значение — встретили сигнал остановки (None).
+        """
+        first = await self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.monotonic() + settings.INGEST_BATCH_WINDOW
+
+        while len(batch) < settings.INGEST_BATCH_MAX:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if pending is None:
+                return batch, True
+            batch.append(pending)
+
+        return batch, False
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = await self._collect()
+            if not batch:
+                continue
+            try:
+                ids = await self._write(batch)
+            except Exception as e:
+                logger.exception(f"Ingest batch of {len(batch)} failed: {e}")
+                await self._write_one_by_one(batch, e)
+                continue
+
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_result(ids.get(pending.key))
+
+    async def _write_one_by_one(self, batch: list[_PendingPost], error: Exception):
+        """Пачка упала — пишем посты по одному, чтобы битая строка не утянула соседей"""
+        groups: dict[tuple[int, int], list[_PendingPost]] = {}
+        for pending in batch:
+            groups.setdefault(pending.key, []).append(pending)
+
+        if len(groups) == 1:
+            self._fail(batch, error)
+            return
+
+        self.retried += 1
+        for key, group in groups.items():
+            try:
+                ids = await self._write(group)
+            except Exception as e:
+                logger.exception(f"Ingest of post {key} failed: {e}")
+                self._fail(group, e)
+                continue
+            for pending in group:
+                if not pending.future.done():
+                    pending.future.set_result(ids.get(key))
+
+    def _fail(self, batch: list[_PendingPost], error: Exception):
+        self.failed += len(batch)
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_exception(error)
+
+    async def _write(self, batch: list[_PendingPost]) -> dict[tuple[int, int], int]:
+        # одно и то же сообщение дважды в пачке — пишем один раз, второй получит тот же id
+        unique = list({pending.key: pending for pending in batch}.values())
+
+        started = time.perf_counter()
+        async with session() as s:
+            rows = (await s.execute(
+                insert(Post)
+                .values([
+                    {
+                        "source_chat_id": p.source_chat_id,
+                        "source_message_id": p.source_message_id,
+                        "media_group_id": p.media_group_id,
+                        "original_text": p.text,
+                        "notified": 0,
+                    }
+                    for p in unique
+                ])
+                # без цели — любой уникальный ключ: uq_post_group (альбом) или uq_post_source_message (одиночный)
+                .on_conflict_do_nothing()
+                .returning(Post.id, Post.source_chat_id, Post.source_message_id)
+            )).all()
+            ids = {(row.source_chat_id, row.source_message_id): row.id for row in rows}
+
+            media = [
+                {"post_id": ids[p.key], "kind": "media", "file_id": str(mid), "sort_index": idx}
+                for p in unique if p.key in ids
+                for idx, mid in enumerate(p.media_msg_ids)
+            ]
+            if media:
+                await s.execute(insert(MediaItem).values(media))
+
+            outbox = [
+                row
+                for post_id in ids.values()
+                for row in notification_outbox.rows(post_id, list(settings.ADMIN_IDS))
+            ]
+            if outbox:
+                await s.execute(
+                    insert(OutboxMessage)
+                    .values(outbox)
+                    .on_conflict_do_nothing(index_elements=[OutboxMessage.idempotency_key])
+                )
+
+            await s.commit()
+
+        notification_outbox.added(len(outbox))
+
+        elapsed = time.perf_counter() - started
+        self.batches += 1
+        self.batched += len(batch)
+        self.posts += len(ids)
+        self.duplicates += len(unique) - len(ids)
+        self.batch_max = max(self.batch_max, len(batch))
+        self.last_batch = len(batch)
+        self.last_commit = elapsed
+        self._commit_total += elapsed
+
+        logger.info(f"💾 Ingest batch: {len(batch)} posts, {len(media)} media, commit {elapsed * 1000:.0f}ms")
+        return ids
+
+    @staticmethod
+    async def add_album_media(
+            source_chat_id: int,
+            media_group_id: str,
+            media_msg_ids: list[int]
+    ) -> tuple[int, int] | None:
+        """
+        Опоздавшие части уже сохранённого альбома: дописать недостающие media_items
+        (порядок — по message_id). Возвращает (id поста, source_message_id), если что-то добавлено.
+        """
+        if not media_msg_ids:
+            return None
+
+        async with session() as s:
+            post = (await s.execute(
+                select(Post).where(Post.source_chat_id == source_chat_id, Post.media_group_id == media_group_id)
+            )).scalar_one_or_none()
+            if not post:
+                return None
+
+            items = (await s.execute(select(MediaItem).where(MediaItem.post_id == post.id))).scalars().all()
+            known = {int(item.file_id) for item in items}
+            missing = [mid for mid in media_msg_ids if mid not in known]
+            if not missing:
+                return None
+
+            order = {mid: idx for idx, mid in enumerate(sorted(known | set(missing)))}
+            for item in items:
+                item.sort_index = order[int(item.file_id)]
+            s.add_all(
+                MediaItem(post_id=post.id, kind="media", file_id=str(mid), sort_index=order[mid])
+                for mid in missing
+            )
+            await s.commit()
+            return post.id, post.source_message_id
+
+    async def stop(self):
+        """Дописать то, что уже в очереди, и остановиться"""
+        if self._task and not self._task.done():
+            await self._queue.put(None)
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "posts": self.posts,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "retried": self.retried,
+            "batch_avg": self.batched / self.batches if self.batches else 0.0,
+            "batch_max": self.batch_max,
+            "last_batch": self.last_batch,
+            "commit_avg": self._commit_total / self.batches if self.batches else 0.0,
+            "last_commit": self.last_commit,
+        }
+
+
+# Глобальный экземпляр
+ingest_writer = IngestWriter()
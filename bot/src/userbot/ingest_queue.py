@@ -0,0 +1,237 @@
+"""
+src/userbot/ingest_queue.py
+Ограниченная очередь между обработчиком событий Telethon и обработкой постов.
+Обработчик только кладёт сообщение в очередь, пул воркеров разбирает.
+При переполнении — INGEST_OVERFLOW: block | drop_oldest | spill.
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable
+
+from sqlalchemy import delete, func, insert, select
+from telethon.tl.types import Channel as TelethonChannel, Message
+
+from src.models.ingest_spill import IngestSpill
+from src.userbot.monitor import monitor
+from src.userbot.shards import shard_pool
+from src.userbot.sources import source_registry
+from src.utils.config import settings
+from src.utils.db import session
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[TelethonChannel, Message], Awaitable[None]]
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+# Сколько ждать разбора очереди при остановке, секунды
+STOP_DRAIN_TIMEOUT = 10.0
+
+
+class IngestQueue:
+    def __init__(self, handler: MessageHandler):
+        self._handler = handler
+        self._queue: asyncio.Queue[tuple[float, Message]] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._drainer: asyncio.Task | None = None
+        self._spill_backlog = 0
+
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.restored = 0
+        self.depth_max = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def policy(self) -> str:
+        policy = settings.INGEST_OVERFLOW.strip().lower()
+        return policy if policy in OVERFLOW_POLICIES else "block"
+
+    async def start(self):
+        if self._workers:
+            return
+
+        self._queue = asyncio.Queue(maxsize=max(1, settings.INGEST_QUEUE_SIZE))
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(max(1, settings.INGEST_WORKERS))
+        ]
+
+        if self.policy == "spill":
+            async with session() as s:
+                self._spill_backlog = (await s.execute(select(func.count()).select_from(IngestSpill))).scalar() or 0
+            self._drainer = asyncio.create_task(self._drain_spill())
+
+        logger.info(
+            f"Ingest queue started: {len(self._workers)} workers, size {self._queue.maxsize}, "
+            f"overflow={self.policy}, spilled backlog {self._spill_backlog}"
+        )
+
+    async def stop(self):
+        if self._drainer:
+            self._drainer.cancel()
+            await asyncio.gather(self._drainer, return_exceptions=True)
+            self._drainer = None
+
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), STOP_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Ingest queue stopped with {self._queue.qsize()} messages left")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+        # недоразобранное при spill не теряем
+        if self._queue is not None and self.policy == "spill":
+            leftovers = []
+            while not self._queue.empty():
+                leftovers.append(self._queue.get_nowait()[1])
+            if leftovers:
+                await self._spill(leftovers)
+
+    async def put(self, message: Message):
+        """Вызывается из обработчика событий Telethon"""
+        if self._queue is None:
+            return
+
+        self.enqueued += 1
+        policy = self.policy
+
+        # порядок записи воркерами не гарантирован — отметка источника ждёт это сообщение
+        source = source_registry.get(message.chat_id)
+        if source:
+            source_registry.track(source, message.id)
+
+        # пока в БД есть отложенные — новые туда же, чтобы не нарушать порядок
+        if policy == "spill" and (self._spill_backlog or self._queue.full()):
+            await self._spill([message])
+            return
+
+        if policy == "drop_oldest" and self._queue.full():
+            _, dropped = self._queue.get_nowait()
+            self._queue.task_done()
+            self.dropped += 1
+            source_registry.untrack(dropped.chat_id, dropped.id)
+            logger.warning(f"Ingest queue full, dropped {dropped.chat_id}/{dropped.id}")
+
+        # block: ждём места — Telethon не читает следующие апдейты, пока не освободится
+        await self._queue.put((time.monotonic(), message))
+        self.depth_max = max(self.depth_max, self._queue.qsize())
+
+    async def _worker(self, n: int):
+        while True:
+            enqueued_at, message = await self._queue.get()
+            wait = time.monotonic() - enqueued_at
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            try:
+                chat = await message.get_chat()
+                if isinstance(chat, TelethonChannel):
+                    await self._handler(chat, message)
+                else:
+                    source_registry.untrack(message.chat_id, message.id)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                source_registry.untrack(message.chat_id, message.id)
+                logger.exception(f"Ingest worker {n} failed on {message.chat_id}/{message.id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _spill(self, messages: list[Message]):
+        try:
+            async with session() as s:
+                await s.execute(
+                    insert(IngestSpill),
+                    [{"chat_id": m.chat_id, "message_id": m.id} for m in messages],
+                )
+                await s.commit()
+            self._spill_backlog += len(messages)
+            self.spilled += len(messages)
+        except Exception as e:
+            self.dropped += len(messages)
+            logger.error(f"Ingest spill failed, {len(messages)} messages lost: {e}")
+            for m in messages:
+                source_registry.untrack(m.chat_id, m.id)
+
+    async def _drain_spill(self):
+        """Возвращать отложенные сообщения в очередь по мере освобождения места"""
+        while True:
+            await asyncio.sleep(settings.INGEST_SPILL_POLL)
+
+            free = self._queue.maxsize - self._queue.qsize()
+            if not self._spill_backlog or free <= 0:
+                continue
+
+            try:
+                await self._restore(free)
+            except Exception as e:
+                logger.error(f"Ingest spill restore failed: {e}")
+
+    async def _restore(self, limit: int):
+        async with session() as s:
+            rows = (await s.execute(
+                select(IngestSpill).order_by(IngestSpill.id.asc()).limit(limit)
+            )).scalars().all()
+
+            if not rows:
+                self._spill_backlog = 0
+                return
+
+            # одним get_messages на чат, аккаунтом-владельцем источника
+            by_chat: dict[int, list[int]] = defaultdict(list)
+            for row in rows:
+                by_chat[row.chat_id].append(row.message_id)
+
+            fetched: dict[tuple[int, int], Message] = {}
+            for chat_id, ids in by_chat.items():
+                client = shard_pool.owner_client(chat_id)
+                if client is None:
+                    continue
+                for message in await client.get_messages(chat_id, ids=ids):
+                    if message:
+                        fetched[(chat_id, message.id)] = message
+
+            for row in rows:
+                message = fetched.get((row.chat_id, row.message_id))
+                if message is not None:
+                    self._queue.put_nowait((time.monotonic(), message))
+                else:
+                    # удалено в источнике или источник без аккаунта — ждать нечего
+                    source_registry.untrack(row.chat_id, row.message_id)
+
+            await s.execute(delete(IngestSpill).where(IngestSpill.id.in_([row.id for row in rows])))
+            await s.commit()
+
+        self._spill_backlog = max(0, self._spill_backlog - len(rows))
+        self.restored += len(fetched)
+        logger.info(f"Ingest spill: restored {len(fetched)} of {len(rows)} messages")
+
+    def stats(self) -> dict:
+        waited = self.processed + self.failed
+        return {
+            "policy": self.policy,
+            "depth": self._queue.qsize() if self._queue is not None else 0,
+            "depth_max": self.depth_max,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "spill_backlog": self._spill_backlog,
+            "wait_avg": self._wait_total / waited if waited else 0.0,
+            "wait_max": self._wait_max,
+        }
+
+
+# Глобальный экземпляр
+ingest_queue = IngestQueue(monitor.on_message)
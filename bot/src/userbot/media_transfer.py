@@ -0,0 +1,87 @@
+"""
+src/userbot/media_transfer.py
+Передача медиа без целого файла в RAM:
+маленькие файлы — в памяти, большие — во временный файл на диске,
+загрузка в Bot API чанками, общий лимит байт «в полёте»
+"""
+
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, AsyncIterator
+
+from aiogram import Bot
+from aiogram.types import InputFile
+from telethon import TelegramClient
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SpooledInputFile(InputFile):
+    """InputFile поверх SpooledTemporaryFile — читается чанками при загрузке"""
+
+    def __init__(self, spool: tempfile.SpooledTemporaryFile, filename: str):
+        super().__init__(filename=filename, chunk_size=settings.MEDIA_UPLOAD_CHUNK)
+        self._spool = spool
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        self._spool.seek(0)
+        while chunk := self._spool.read(self.chunk_size):
+            yield chunk
+
+
+class ByteBudget:
+    """Глобальный лимит байт медиа, которые сейчас скачиваются/загружаются"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self._cond = asyncio.Condition()
+
+    @asynccontextmanager
+    async def reserve(self, size: int) -> AsyncIterator[None]:
+        # файл больше лимита занимает весь лимит, но не блокируется навсегда
+        size = max(1, min(size, self.limit))
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight + size <= self.limit)
+            self.in_flight += size
+        try:
+            yield
+        finally:
+            async with self._cond:
+                self.in_flight -= size
+                self._cond.notify_all()
+
+
+# Глобальный экземпляр
+media_budget = ByteBudget(settings.MEDIA_MAX_INFLIGHT_BYTES)
+
+
+def media_size(msg) -> int:
+    """Размер файла по метаданным Telethon (0, если неизвестен)"""
+    file = getattr(msg, "file", None)
+    return (getattr(file, "size", None) or 0) if file else 0
+
+
+def open_spool() -> tempfile.SpooledTemporaryFile:
+    """Временное хранилище: до MEDIA_SPOOL_MAX_MEMORY — в памяти, больше — на диске"""
+    return tempfile.SpooledTemporaryFile(
+        max_size=settings.MEDIA_SPOOL_MAX_MEMORY,
+        dir=settings.MEDIA_SPOOL_DIR or None,
+    )
+
+
+async def download_to_spool(client: TelegramClient, msg, spool: tempfile.SpooledTemporaryFile) -> bool:
+    """Скачать медиа в spool. False — скачать не удалось/файл пустой"""
+    result = await client.download_media(msg, file=spool)
+    return result is not None and spool.tell() > 0
+
+
+@asynccontextmanager
+async def spooled_download(client: TelegramClient, msg) -> AsyncIterator[tempfile.SpooledTemporaryFile | None]:
+    """Скачать одно медиа во временное хранилище. Файл живёт до выхода из контекста"""
+    with open_spool() as spool:
+        yield spool if await download_to_spool(client, msg, spool) else None
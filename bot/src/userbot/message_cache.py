@@ -0,0 +1,113 @@
+"""
+src/userbot/message_cache.py
+Кеш Telethon-сообщений источников: (chat_id, msg_id) → Message.
+Заполняется при приёме поста, читается превью и публикацией.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, TypeVar
+
+from telethon import TelegramClient
+from telethon.errors import FileReferenceExpiredError
+from telethon.tl.types import Message
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class MessageCache:
+    """
+    LRU + TTL. chat_id — в формате бота (-100...).
+    Сообщение привязано к аккаунту, который его получил: медиа скачивает только он.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self._mem: OrderedDict[tuple[int, int], tuple[float, Message]] = OrderedDict()
+        self._max_size = max_size
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def get(self, chat_id: int, msg_id: int, client: TelegramClient | None = None) -> Message | None:
+        """client — вернуть, только если сообщение получено этим аккаунтом"""
+        key = (chat_id, msg_id)
+        entry = self._mem.get(key)
+        if entry is None:
+            return None
+        if client is not None and getattr(entry[1], "_client", None) is not client:
+            return None
+
+        stored_at, message = entry
+        if time.monotonic() - stored_at > self._ttl:
+            del self._mem[key]
+            return None
+
+        self._mem.move_to_end(key)
+        return message
+
+    def put(self, chat_id: int, message: Message):
+        key = (chat_id, message.id)
+        self._mem[key] = (time.monotonic(), message)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self._max_size:
+            self._mem.popitem(last=False)
+
+    async def fetch(
+            self,
+            client: TelegramClient,
+            chat_id: int,
+            msg_ids: list[int],
+            refresh: bool = False
+    ) -> list[Message | None]:
+        """Сообщения в порядке msg_ids; недостающие — одним get_messages"""
+        found = {} if refresh else {mid: m for mid in msg_ids if (m := self.get(chat_id, mid, client)) is not None}
+        missing = [mid for mid in msg_ids if mid not in found]
+
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            fetched = await client.get_messages(chat_id, ids=missing)
+            for message in fetched:
+                if message:
+                    self.put(chat_id, message)
+                    found[message.id] = message
+
+        return [found.get(mid) for mid in msg_ids]
+
+    async def use(
+            self,
+            client: TelegramClient,
+            chat_id: int,
+            msg_ids: list[int],
+            action: Callable[[list[Message | None]], Awaitable[T]]
+    ) -> T:
+        """Выполнить action над сообщениями; протухший file_reference — перечитать и повторить один раз"""
+        messages = await self.fetch(client, chat_id, msg_ids)
+        try:
+            return await action(messages)
+        except FileReferenceExpiredError:
+            logger.info(f"File reference expired for {chat_id}/{msg_ids}, refetching")
+            self.refreshes += 1
+            messages = await self.fetch(client, chat_id, msg_ids, refresh=True)
+            return await action(messages)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._mem),
+        }
+
+
+# Глобальный экземпляр
+message_cache = MessageCache(settings.MESSAGE_CACHE_SIZE, settings.MESSAGE_CACHE_TTL)
@@ -0,0 +1,230 @@
+"""
+src/userbot/outbox.py
+Outbox уведомлений админам: строка на (пост, админ) в notification_outbox,
+воркер забирает пачки через SELECT ... FOR UPDATE SKIP LOCKED и доставляет
+не меньше одного раза — с повторами и экспоненциальной задержкой (учитывает retry_after).
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from telethon.errors import FloodWaitError
+
+from src.models.notification_outbox import OutboxMessage
+from src.utils.config import settings
+from src.utils.db import session
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[int, int], Awaitable[None]]
+
+# Окно для расчёта пропускной способности, секунды
+THROUGHPUT_WINDOW = 60.0
+
+
+def idempotency_key(post_id: int, admin_id: int) -> str:
+    return f"post:{post_id}:admin:{admin_id}"
+
+
+def _retry_after(error: Exception) -> float:
+    if isinstance(error, TelegramRetryAfter):
+        return float(error.retry_after)
+    if isinstance(error, FloodWaitError):
+        return float(error.seconds)
+    return 0.0
+
+
+def backoff(attempts: int, retry_after: float = 0.0) -> float:
+    """Задержка перед попыткой attempts+1: 2^n с разбросом, не меньше retry_after"""
+    delay = min(settings.OUTBOX_BACKOFF_BASE * 2 ** max(0, attempts - 1), settings.OUTBOX_BACKOFF_MAX)
+    return max(delay * random.uniform(0.8, 1.2), retry_after)
+
+
+class NotificationOutbox:
+    def __init__(self):
+        self._deliver: Deliver | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+        self.enqueued = 0
+        self.delivered = 0
+        self.retried = 0
+        self.failed = 0
+        self.claims = 0
+        self._latency_total = 0.0
+        self._recent: deque[float] = deque()
+
+    def set_deliver(self, deliver: Deliver):
+        """deliver(post_id, admin_id) — отправить уведомление; исключение — попытка не удалась"""
+        self._deliver = deliver
+
+    @staticmethod
+    def rows(post_id: int, admin_ids: list[int]) -> list[dict]:
+        """Строки outbox для поста — вставляются в транзакции, которая записывает сам пост"""
+        return [
+            {"idempotency_key": idempotency_key(post_id, admin_id), "post_id": post_id, "admin_id": admin_id}
+            for admin_id in admin_ids
+        ]
+
+    async def enqueue(self, post_id: int, admin_ids: list[int]):
+        """Поставить уведомления о посте всем админам (повторно — без дублей)"""
+        if not admin_ids:
+            return
+
+        async with session() as s:
+            result = await s.execute(
+                insert(OutboxMessage)
+                .values(self.rows(post_id, admin_ids))
+                .on_conflict_do_nothing(index_elements=[OutboxMessage.idempotency_key])
+            )
+            await s.commit()
+
+        self.added(result.rowcount or 0)
+
+    def added(self, count: int):
+        """Строки уже закоммичены вызывающим — разбудить воркер"""
+        self.enqueued += count
+        self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                claimed = await self._claim()
+            except Exception as e:
+                logger.error(f"Outbox claim failed: {e}")
+                claimed = []
+
+            if claimed:
+                await self._process(claimed)
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> list[OutboxMessage]:
+        """Забрать пачку готовых строк: параллельные воркеры/процессы берут разные"""
+        due = (
+            select(OutboxMessage.id)
+            .where(
+                OutboxMessage.status == "pending",
+                OutboxMessage.next_attempt_at <= func.now(),
+                or_(OutboxMessage.locked_until.is_(None), OutboxMessage.locked_until < func.now()),
+            )
+            .order_by(OutboxMessage.next_attempt_at)
+            .limit(settings.OUTBOX_BATCH)
+            .with_for_update(skip_locked=True)
+        )
+
+        async with session() as s:
+            rows = (await s.execute(
+                update(OutboxMessage)
+                .where(OutboxMessage.id.in_(due.scalar_subquery()))
+                .values(
+                    attempts=OutboxMessage.attempts + 1,
+                    locked_until=func.now() + timedelta(seconds=settings.OUTBOX_LEASE),
+                )
+                .returning(OutboxMessage)
+            )).scalars().all()
+            await s.commit()
+
+        if rows:
+            self.claims += 1
+        return list(rows)
+
+    async def _process(self, claimed: list[OutboxMessage]):
+        semaphore = asyncio.Semaphore(max(1, settings.NOTIFY_CONCURRENCY))
+
+        async def attempt(row: OutboxMessage) -> dict:
+            async with semaphore:
+                try:
+                    await self._deliver(row.post_id, row.admin_id)
+                except Exception as e:
+                    return self._on_error(row, e)
+
+            now = datetime.now(timezone.utc)
+            self._on_delivered(now, row.created_at)
+            return {"id": row.id, "status": "done", "sent_at": now, "locked_until": None, "last_error": None}
+
+        results = await asyncio.gather(*(attempt(row) for row in claimed))
+
+        # итог пачки — одним UPDATE по первичному ключу
+        try:
+            async with session() as s:
+                await s.execute(update(OutboxMessage), results)
+                await s.commit()
+        except Exception as e:
+            # строки вернутся по истечении аренды — возможна повторная доставка
+            logger.error(f"Outbox status update failed: {e}")
+
+    def _on_error(self, row: OutboxMessage, error: Exception) -> dict:
+        permanent = isinstance(error, TelegramForbiddenError)  # админ заблокировал бота
+        if permanent or row.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            self.failed += 1
+            logger.error(f"Outbox #{row.id} (post #{row.post_id} → {row.admin_id}) failed after {row.attempts} attempts: {error}")
+            return {"id": row.id, "status": "failed", "locked_until": None, "last_error": str(error)[:1000]}
+
+        delay = backoff(row.attempts, _retry_after(error))
+        self.retried += 1
+        logger.warning(f"Outbox #{row.id} (post #{row.post_id} → {row.admin_id}) retry in {delay:.0f}s: {error}")
+        return {
+            "id": row.id,
+            "next_attempt_at": datetime.now(timezone.utc) + timedelta(seconds=delay),
+            "locked_until": None,
+            "last_error": str(error)[:1000],
+        }
+
+    def _on_delivered(self, now: datetime, created_at: datetime | None):
+        self.delivered += 1
+        if created_at is not None:
+            self._latency_total += (now - created_at).total_seconds()
+
+        mono = time.monotonic()
+        self._recent.append(mono)
+        while self._recent and self._recent[0] < mono - THROUGHPUT_WINDOW:
+            self._recent.popleft()
+
+    async def stats(self) -> dict:
+        try:
+            async with session() as s:
+                pending = (await s.execute(
+                    select(func.count()).select_from(OutboxMessage).where(OutboxMessage.status == "pending")
+                )).scalar() or 0
+        except Exception as e:
+            logger.error(f"Outbox stats failed: {e}")
+            pending = -1
+
+        mono = time.monotonic()
+        return {
+            "pending": pending,
+            "enqueued": self.enqueued,
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "failed": self.failed,
+            "per_minute": sum(1 for t in self._recent if t >= mono - THROUGHPUT_WINDOW),
+            "latency_avg": self._latency_total / self.delivered if self.delivered else 0.0,
+        }
+
+
+# Глобальный экземпляр
+notification_outbox = NotificationOutbox()
@@ -0,0 +1,339 @@
+"""
+src/userbot/preview.py
+Превью поста админу через aiogram-бота.
+Медиа скачивается из источника и загружается в Bot API один раз,
+дальше превью отправляются по сохранённым file_id.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import ExitStack
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.types import (
+    InputMediaPhoto,
+    InputMediaVideo,
+    InputMediaDocument,
+    Message as BotMessage,
+)
+from sqlalchemy import select, update
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+from src.models.media_item import MediaItem
+from src.models.post import Post
+from src.userbot.media_transfer import (
+    SpooledInputFile,
+    download_to_spool,
+    media_budget,
+    media_size,
+    open_spool,
+    spooled_download,
+)
+from src.userbot.message_cache import message_cache
+from src.userbot.publisher import has_sendable_media
+from src.utils.config import settings
+from src.utils.db import session
+from src.utils.tg_format import md_to_html, split_html_safe, split_caption_and_tail
+from src.utils.utils import delete_admin_messages
+
+logger = logging.getLogger(__name__)
+
+# (kind, file_id) — kind: photo / video / animation / audio / voice / document
+MediaRef = tuple[str, str]
+
+
+def extract_file_ref(m: BotMessage) -> MediaRef | None:
+    """file_id из сообщения, которое вернул Bot API"""
+    if m.photo:
+        return "photo", m.photo[-1].file_id
+    if m.video:
+        return "video", m.video.file_id
+    if m.animation:
+        return "animation", m.animation.file_id
+    if m.audio:
+        return "audio", m.audio.file_id
+    if m.voice:
+        return "voice", m.voice.file_id
+    if m.document:
+        return "document", m.document.file_id
+    return None
+
+
+class MediaFileStore:
+    """
+    file_id Bot API по (source_chat_id, source_message_id) поста.
+    Память + MediaItem.bot_file_id в БД, лок на ключ — чтобы при параллельной
+    рассылке скачивал и загружал только первый админ.
+    """
+
+    def __init__(self, max_size: int = 2048):
+        self._mem: OrderedDict[tuple[int, int], list[MediaRef]] = OrderedDict()
+        self._locks: dict[tuple[int, int], asyncio.Lock] = {}
+        self._rejected: set[tuple[int, int]] = set()
+        self._max_size = max_size
+
+    def lock(self, chat_id: int, message_id: int) -> asyncio.Lock:
+        key = (chat_id, message_id)
+        lock = self._locks.get(key)
+        if lock is None:
+            if len(self._locks) > self._max_size:
+                self._locks = {k: v for k, v in self._locks.items() if v.locked()}
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    def _remember(self, key: tuple[int, int], refs: list[MediaRef]):
+        self._mem[key] = refs
+        self._mem.move_to_end(key)
+        while len(self._mem) > self._max_size:
+            self._mem.popitem(last=False)
+
+    async def get(self, chat_id: int, message_id: int) -> list[MediaRef] | None:
+        key = (chat_id, message_id)
+        refs = self._mem.get(key)
+        if refs is not None:
+            return refs
+        if key in self._rejected:
+            return None
+
+        async with session() as s:
+            rows = (await s.execute(
+                select(MediaItem.kind, MediaItem.bot_file_id)
+                .join(Post, Post.id == MediaItem.post_id)
+                .where(Post.source_chat_id == chat_id, Post.source_message_id == message_id)
+                .order_by(MediaItem.sort_index.asc())
+            )).all()
+
+        if not rows or any(not file_id for _, file_id in rows):
+            return None
+
+        refs = [(kind, file_id) for kind, file_id in rows]
+        self._remember(key, refs)
+        return refs
+
+    def forget(self, chat_id: int, message_id: int):
+        """Сбросить file_id из памяти (например, Bot API их не принял) — следующая отправка перезальёт"""
+        self._mem.pop((chat_id, message_id), None)
+        if len(self._rejected) > self._max_size:
+            self._rejected.clear()
+        self._rejected.add((chat_id, message_id))
+
+    async def put(self, chat_id: int, message_id: int, uploaded: list[tuple[int, MediaRef]]):
+        """uploaded — [(id сообщения-источника, (kind, file_id)), ...] в порядке альбома"""
+        self._rejected.discard((chat_id, message_id))
+        self._remember((chat_id, message_id), [ref for _, ref in uploaded])
+
+        try:
+            async with session() as s:
+                post_ids = select(Post.id).where(
+                    Post.source_chat_id == chat_id, Post.source_message_id == message_id
+                ).scalar_subquery()
+                for mid, (kind, file_id) in uploaded:
+                    await s.execute(
+                        update(MediaItem)
+                        .where(MediaItem.post_id.in_(post_ids), MediaItem.file_id == str(mid))
+                        .values(kind=kind, bot_file_id=file_id)
+                    )
+                await s.commit()
+        except Exception as e:
+            logger.error(f"Failed to store file_ids for {chat_id}/{message_id}: {e}")
+
+
+# Глобальный экземпляр
+media_store = MediaFileStore()
+
+
+async def _send_tail(bot: Bot, admin_id: int, tail: str, msg_ids: list[int]):
+    """хвост текста отдельными сообщениями (без ломания HTML)"""
+    for chunk in split_html_safe(tail, limit=4096):
+        m = await bot.send_message(admin_id, chunk, parse_mode="HTML", disable_web_page_preview=True)
+        msg_ids.append(m.message_id)
+
+
+async def _send_refs(bot: Bot, admin_id: int, refs: list[MediaRef], caption: str) -> list[BotMessage]:
+    """Отправить медиа по file_id (без скачивания и загрузки)"""
+    if len(refs) == 1:
+        kind, file_id = refs[0]
+        cap = caption or None
+        if kind == "photo":
+            return [await bot.send_photo(admin_id, file_id, caption=cap, parse_mode="HTML")]
+        if kind == "video":
+            return [await bot.send_video(admin_id, file_id, caption=cap, parse_mode="HTML")]
+        if kind == "animation":
+            return [await bot.send_animation(admin_id, file_id, caption=cap, parse_mode="HTML")]
+        if kind == "audio":
+            return [await bot.send_audio(admin_id, file_id, caption=cap, parse_mode="HTML")]
+        if kind == "voice":
+            return [await bot.send_voice(admin_id, file_id, caption=cap, parse_mode="HTML")]
+        return [await bot.send_document(admin_id, file_id, caption=cap, parse_mode="HTML")]
+
+    media_group = []
+    for i, (kind, file_id) in enumerate(refs):
+        cap = caption if i == 0 and caption else None
+        if kind == "photo":
+            media_group.append(InputMediaPhoto(media=file_id, caption=cap, parse_mode="HTML"))
+        elif kind == "video":
+            media_group.append(InputMediaVideo(media=file_id, caption=cap, parse_mode="HTML"))
+        else:
+            media_group.append(InputMediaDocument(media=file_id, caption=cap, parse_mode="HTML"))
+    return await bot.send_media_group(admin_id, media_group)
+
+
+async def _upload_from_source(
+        bot: Bot,
+        client: TelegramClient,
+        admin_id: int,
+        source_chat_id: int,
+        source_message_id: int,
+        media_msg_ids: list[int],
+        caption: str
+) -> list[BotMessage]:
+    """Скачать медиа из источника и загрузить (первая отправка). Сохраняет file_id"""
+    async def upload(messages: list) -> list[BotMessage]:
+        return await _upload_messages(bot, client, admin_id, source_chat_id, source_message_id, messages, caption)
+
+    # сообщения — из кеша, недостающие одним get_messages по сохранённым message_id
+    return await message_cache.use(client, source_chat_id, media_msg_ids, upload)
+
+
+async def _upload_messages(
+        bot: Bot,
+        client: TelegramClient,
+        admin_id: int,
+        source_chat_id: int,
+        source_message_id: int,
+        messages: list,
+        caption: str
+) -> list[BotMessage]:
+    album_msgs = [m for m in messages if m and has_sendable_media(m)]
+
+    # альбом
+    if len(album_msgs) > 1:
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(max(1, settings.MEDIA_DOWNLOAD_CONCURRENCY))
+
+        async def fetch(m, spool) -> bool:
+            async with semaphore:
+                return await download_to_spool(client, m, spool)
+
+        # весь альбом держим до send_media_group — резервируем его размер целиком
+        async with media_budget.reserve(sum(media_size(m) for m in album_msgs)), ExitStack() as stack:
+            spools = [stack.enter_context(open_spool()) for _ in album_msgs]
+            downloaded = await asyncio.gather(*(fetch(m, sp) for m, sp in zip(album_msgs, spools)))
+            download_time = time.perf_counter() - started
+
+            media_group = []
+            source_ids = []
+            for i, (m, spool, ok) in enumerate(zip(album_msgs, spools, downloaded)):
+                if not ok:
+                    continue
+
+                input_file = SpooledInputFile(spool, filename=f"media_{i}")
+                cap = caption if not media_group and caption else None
+
+                if m.photo:
+                    media_group.append(InputMediaPhoto(media=input_file, caption=cap, parse_mode="HTML"))
+                elif m.video:
+                    media_group.append(InputMediaVideo(media=input_file, caption=cap, parse_mode="HTML"))
+                else:
+                    media_group.append(InputMediaDocument(media=input_file, caption=cap, parse_mode="HTML"))
+                source_ids.append(m.id)
+
+            if media_group:
+                result = await bot.send_media_group(admin_id, media_group)
+                logger.info(
+                    f"🖼 Album preview {source_chat_id}/{source_message_id}: {len(media_group)} items, "
+                    f"download {download_time:.2f}s, total {time.perf_counter() - started:.2f}s"
+                )
+                refs = [extract_file_ref(m) for m in result]
+                if len(refs) == len(source_ids) and all(refs):
+                    await media_store.put(source_chat_id, source_message_id, list(zip(source_ids, refs)))
+                return result
+
+    # одиночное медиа
+    if len(album_msgs) == 1:
+        msg = album_msgs[0]
+        async with media_budget.reserve(media_size(msg)), spooled_download(client, msg) as spool:
+            if spool is not None:
+                input_file = SpooledInputFile(spool, filename="media")
+                if msg.photo:
+                    res = await bot.send_photo(admin_id, input_file, caption=caption or None, parse_mode="HTML")
+                elif msg.video:
+                    res = await bot.send_video(admin_id, input_file, caption=caption or None, parse_mode="HTML")
+                else:
+                    res = await bot.send_document(admin_id, input_file, caption=caption or None, parse_mode="HTML")
+
+                ref = extract_file_ref(res)
+                if ref:
+                    await media_store.put(source_chat_id, source_message_id, [(msg.id, ref)])
+                return [res]
+
+    return []
+
+
+async def send_preview(
+        bot: Bot,
+        client: TelegramClient | None,
+        admin_id: int,
+        text: str,
+        source_chat_id: int,
+        source_message_id: int,
+        media_msg_ids: list[int],
+        raise_transient: bool = False
+) -> list[int]:
+    """
+    Отправить превью поста (текст/медиа/альбом). Возвращает message_id(ы).
+    media_msg_ids — message_id медиа в источнике (MediaItem.file_id) в порядке sort_index.
+    FloodWait (и при raise_transient — временные ошибки Bot API) уходят наверх для повтора,
+    уже отправленная часть превью перед этим удаляется.
+    """
+    msg_ids: list[int] = []
+
+    try:
+        html_text = md_to_html(text)
+        caption, tail = split_caption_and_tail(html_text, caption_limit=1024)
+
+        if media_msg_ids and source_chat_id and source_message_id:
+            sent: list[BotMessage] = []
+            refs = await media_store.get(source_chat_id, source_message_id)
+
+            if refs:
+                try:
+                    sent = await _send_refs(bot, admin_id, refs, caption)
+                except TelegramBadRequest as e:
+                    logger.warning(f"Cached file_id rejected for {source_chat_id}/{source_message_id}: {e}")
+                    media_store.forget(source_chat_id, source_message_id)
+
+            if not sent and client:
+                async with media_store.lock(source_chat_id, source_message_id):
+                    # пока ждали лок, другой админ мог уже загрузить
+                    refs = await media_store.get(source_chat_id, source_message_id)
+                    if refs:
+                        sent = await _send_refs(bot, admin_id, refs, caption)
+                    else:
+                        sent = await _upload_from_source(
+                            bot, client, admin_id, source_chat_id, source_message_id, media_msg_ids, caption
+                        )
+
+            if sent:
+                msg_ids.extend(m.message_id for m in sent)
+                await _send_tail(bot, admin_id, tail, msg_ids)
+                return msg_ids
+
+        # только текст
+        await _send_tail(bot, admin_id, html_text, msg_ids)
+
+    except (FloodWaitError, TelegramRetryAfter, TelegramNetworkError, TelegramServerError) as e:
+        if not raise_transient and not isinstance(e, FloodWaitError):
+            logger.error(f"Failed to send preview to admin {admin_id}: {e}")
+            return msg_ids
+        # наверх: пул аккаунтов / outbox повторят — полупревью не оставляем, иначе будет дубль
+        await delete_admin_messages(bot, {admin_id: msg_ids})
+        raise
+    except Exception as e:
+        logger.error(f"Failed to send preview to admin {admin_id}: {e}")
+
+    return msg_ids
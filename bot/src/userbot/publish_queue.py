@@ -0,0 +1,337 @@
+"""
+src/userbot/publish_queue.py
+Отложенная публикация: одобренные посты ждут в publish_queue своего слота
+(сетка PUBLISH_SLOT_INTERVAL внутри PUBLISH_WINDOWS, не чаще PUBLISH_MIN_GAP).
+Один воркер спит до ближайшего слота и публикует по порядку; очередь в БД
+переживает рестарт — просроченные за время простоя слоты уходят с тем же MIN_GAP.
+"""
+
+import asyncio
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from aiogram import Bot
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from telethon.errors import FloodWaitError
+
+from src.models.channel import Channel
+from src.models.media_item import MediaItem
+from src.models.post import Post
+from src.models.publish_queue import ScheduledPost
+from src.userbot.publisher import PartialPublishError, publish_post
+from src.userbot.shards import shard_pool
+from src.utils.config import settings
+from src.utils.db import session
+from src.utils.utils import delete_admin_messages, load_admin_messages
+
+logger = logging.getLogger(__name__)
+
+# Воркер перечитывает очередь не реже, чем раз в столько секунд
+MAX_SLEEP = 60.0
+
+
+def publish_tz() -> ZoneInfo:
+    return ZoneInfo(settings.PUBLISH_TIMEZONE)
+
+
+def next_slot(earliest: datetime) -> datetime:
+    """Первый слот не раньше earliest: точка сетки PUBLISH_SLOT_INTERVAL внутри одного из окон"""
+    tz = publish_tz()
+    local = earliest.astimezone(tz)
+    interval = timedelta(minutes=settings.PUBLISH_SLOT_INTERVAL)
+    windows = settings.publish_windows or [(datetime.min.time(), datetime.min.time())]  # сутки целиком
+
+    candidates = []
+    # со вчерашнего дня — окно через полночь могло начаться вчера
+    for offset in range(-1, 8):
+        day = local.date() + timedelta(days=offset)
+        for start, end in windows:
+            window_start = datetime.combine(day, start, tz)
+            window_end = datetime.combine(day, end, tz)
+            if window_end <= window_start:
+                window_end += timedelta(days=1)
+            if window_end <= local:
+                continue
+
+            if interval:
+                steps = math.ceil(max(timedelta(0), local - window_start) / interval)
+                slot = window_start + steps * interval
+            else:
+                slot = max(local, window_start)
+
+            if slot < window_end:
+                candidates.append(slot)
+
+    if not candidates:
+        return earliest  # окна настроены так, что слотов нет — не держим пост
+    return min(candidates).astimezone(timezone.utc)
+
+
+class PublishQueue:
+    def __init__(self):
+        self._bot: Bot | None = None
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        # слот считается по хвосту очереди — две постановки подряд не должны получить один
+        self._lock = asyncio.Lock()
+        self._last_published: datetime | None = None
+        self._last_loaded = False
+
+        self.queued = 0
+        self.published = 0
+        self.retried = 0
+        self.failed = 0
+        self.cancelled = 0
+
+    def set_bot(self, bot: Bot):
+        """Бот — убрать уведомления о посте у админов и сообщить об ошибке публикации"""
+        self._bot = bot
+
+    async def enqueue(self, post_id: int, text: str, admin_id: int) -> datetime | None:
+        """
+        Поставить пост в очередь. Возвращает слот или None, если пост уже в очереди.
+        Строка поста, который раньше не опубликовался (failed) или был снят (cancelled), ставится заново.
+        """
+        async with self._lock:
+            slot = await self.next_free_slot()
+
+            stmt = insert(ScheduledPost).values(post_id=post_id, text=text, queued_by=admin_id, slot_at=slot)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ScheduledPost.post_id],
+                set_={
+                    "text": stmt.excluded.text,
+                    "queued_by": stmt.excluded.queued_by,
+                    "slot_at": stmt.excluded.slot_at,
+                    "status": "pending",
+                    "attempts": 0,
+                    "last_error": None,
+                    "created_at": func.now(),
+                },
+                where=ScheduledPost.status.in_(("failed", "cancelled")),
+            )
+            async with session() as s:
+                queued_id = (await s.execute(stmt.returning(ScheduledPost.id))).scalar_one_or_none()
+                await s.commit()
+
+        if queued_id is None:
+            return None
+
+        self.queued += 1
+        self._wakeup.set()
+        logger.info(f"🕒 Post #{post_id} queued for {slot.isoformat()}")
+        return slot
+
+    async def next_free_slot(self) -> datetime:
+        """Слот для следующей постановки: после хвоста очереди и последней публикации + MIN_GAP"""
+        gap = timedelta(minutes=settings.PUBLISH_MIN_GAP)
+        earliest = datetime.now(timezone.utc)
+
+        async with session() as s:
+            tail = (await s.execute(
+                select(ScheduledPost.slot_at)
+                .where(ScheduledPost.status == "pending")
+                .order_by(ScheduledPost.slot_at.desc())
+                .limit(1)
+            )).scalar_one_or_none()
+
+        last_published = await self._last_published_at()
+        for anchor in (tail, last_published):
+            if anchor is not None:
+                earliest = max(earliest, anchor + gap)
+
+        # без MIN_GAP два поста могли бы встать в один и тот же слот сетки
+        if tail is not None and not gap:
+            earliest = max(earliest, tail + timedelta(seconds=1))
+
+        return next_slot(earliest)
+
+    async def upcoming(self, limit: int = 10) -> tuple[list[ScheduledPost], int]:
+        """Ближайшие слоты (по индексу ix_publish_queue_due) и общее число ждущих"""
+        async with session() as s:
+            rows = (await s.execute(
+                select(ScheduledPost)
+                .where(ScheduledPost.status == "pending")
+                .order_by(ScheduledPost.slot_at, ScheduledPost.id)
+                .limit(limit)
+            )).scalars().all()
+            total = (await s.execute(
+                select(func.count()).select_from(ScheduledPost).where(ScheduledPost.status == "pending")
+            )).scalar() or 0
+
+        return list(rows), total
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _last_published_at(self) -> datetime | None:
+        if not self._last_loaded:
+            async with session() as s:
+                self._last_published = (await s.execute(
+                    select(func.max(ScheduledPost.published_at)).where(ScheduledPost.status == "done")
+                )).scalar()
+            self._last_loaded = True
+        return self._last_published
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                item = await self._next()
+                if item is None:
+                    delay = MAX_SLEEP
+                else:
+                    due = item.slot_at
+                    last_published = await self._last_published_at()
+                    if last_published is not None:
+                        due = max(due, last_published + timedelta(minutes=settings.PUBLISH_MIN_GAP))
+                    delay = (due - datetime.now(timezone.utc)).total_seconds()
+
+                    if delay <= 0:
+                        await self._publish(item)
+                        continue
+            except Exception as e:
+                logger.exception(f"Publish queue error: {e}")
+                delay = MAX_SLEEP
+
+            # новый пост может встать раньше текущего ближайшего — тогда разбудят
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), min(delay, MAX_SLEEP))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _next(self) -> ScheduledPost | None:
+        async with session() as s:
+            return (await s.execute(
+                select(ScheduledPost)
+                .where(ScheduledPost.status == "pending")
+                .order_by(ScheduledPost.slot_at, ScheduledPost.id)
+                .limit(1)
+            )).scalar_one_or_none()
+
+    async def _publish(self, item: ScheduledPost):
+        async with session() as s:
+            post = await s.get(Post, item.post_id) if item.post_id else None
+            if post is None:
+                # пост удалили или опубликовали вручную, пока он ждал слота
+                await self._finish(item.id, status="cancelled")
+                self.cancelled += 1
+                return
+
+            target = (await s.execute(
+                select(Channel).where(Channel.role == "target", Channel.is_active == True)
+            )).scalars().first()
+            media_msg_ids = [int(file_id) for file_id in (await s.execute(
+                select(MediaItem.file_id).where(MediaItem.post_id == post.id).order_by(MediaItem.sort_index.asc())
+            )).scalars().all()]
+
+        error = None
+        retry_after = 0.0
+        if not target:
+            error = "Target не задан"
+        else:
+            try:
+                # аккаунт, состоящий и в источнике, и в целевом канале
+                published = await shard_pool.run([post.source_chat_id, target.chat_id], lambda client: publish_post(
+                    client,
+                    target.chat_id,
+                    item.text,
+                    post.source_chat_id,
+                    media_msg_ids
+                ))
+                if not published:
+                    error = "publish_post failed"
+            except PartialPublishError as e:
+                # часть поста уже в канале — повтор её продублирует, решает админ
+                await self._on_error(item, str(e), final=True)
+                return
+            except FloodWaitError as e:
+                error, retry_after = f"FloodWait {e.seconds}s", float(e.seconds)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+
+        if error:
+            await self._on_error(item, error, retry_after)
+            return
+
+        now = datetime.now(timezone.utc)
+        self._last_published = now
+        self.published += 1
+        logger.info(f"📤 Published queued post #{post.id} (slot {item.slot_at.isoformat()})")
+
+        # сразу фиксируем публикацию — рестарт во время уборки не должен опубликовать пост второй раз
+        async with session() as s:
+            await s.execute(
+                update(ScheduledPost)
+                .where(ScheduledPost.id == item.id)
+                .values(status="done", published_at=now, last_error=None)
+            )
+            stale = await s.get(Post, post.id)
+            if stale:
+                await s.delete(stale)
+            await s.commit()
+
+        # как при ручной публикации: уведомления у админов больше не нужны
+        if self._bot:
+            try:
+                await delete_admin_messages(
+                    self._bot, load_admin_messages(post.preview_msg_ids, post.control_msg_id, item.queued_by)
+                )
+            except Exception as e:
+                logger.error(f"Failed to delete preview msgs for post #{post.id}: {e}")
+
+    async def _on_error(self, item: ScheduledPost, error: str, retry_after: float = 0.0, final: bool = False):
+        attempts = item.attempts + 1
+        if final or attempts >= settings.PUBLISH_MAX_ATTEMPTS:
+            self.failed += 1
+            logger.error(f"Queued post #{item.post_id} failed after {attempts} attempts: {error}")
+            await self._finish(item.id, status="failed", attempts=attempts, last_error=error[:1000])
+            if self._bot:
+                try:
+                    await self._bot.send_message(
+                        item.queued_by, f"❌ Пост #{item.post_id} из очереди не опубликован: {error}"
+                    )
+                except Exception as e:
+                    logger.error(f"Failed to report publish error to {item.queued_by}: {e}")
+            return
+
+        # повтор сдвигает только этот пост — остальные выходят в свои слоты;
+        # сам повтор — тоже в слот сетки внутри PUBLISH_WINDOWS
+        delay = max(settings.PUBLISH_RETRY_DELAY, retry_after)
+        self.retried += 1
+        logger.warning(f"Queued post #{item.post_id} retry in {delay:.0f}s: {error}")
+        await self._finish(
+            item.id,
+            attempts=attempts,
+            last_error=error[:1000],
+            slot_at=next_slot(datetime.now(timezone.utc) + timedelta(seconds=delay)),
+        )
+
+    @staticmethod
+    async def _finish(item_id: int, **values):
+        async with session() as s:
+            await s.execute(update(ScheduledPost).where(ScheduledPost.id == item_id).values(**values))
+            await s.commit()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queued,
+            "published": self.published,
+            "retried": self.retried,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "last_published": self._last_published,
+        }
+
+
+# Глобальный экземпляр
+publish_queue = PublishQueue()
@@ -3,15 +3,25 @@ src/userbot/publisher.py
 Публикация постов через юзербот (с поддержкой альбомов)
 """
 
-import re
 import logging
+from telethon.errors import FloodWaitError
 from telethon.tl.types import MessageMediaWebPage
 
+from src.userbot.message_cache import message_cache
 from src.utils.tg_format import md_to_html, split_html_safe
 
 logger = logging.getLogger(__name__)
 
 
+class PartialPublishError(Exception):
+    """Часть сообщений уже в целевом канале — повтор публикации продублировал бы их"""
+
+    def __init__(self, sent: int, error: Exception):
+        super().__init__(f"опубликовано частично ({sent} сообщ.): {error}")
+        self.sent = sent
+        self.error = error
+
+
 def has_sendable_media(msg) -> bool:
     if not msg or not msg.media:
         return False
@@ -21,67 +31,57 @@ def has_sendable_media(msg) -> bool:
 
 
 
-async def publish_post(client, target_chat_id: int, text: str, source_chat_id: int, source_message_id: int, has_media: bool) -> bool:
+async def publish_post(client, target_chat_id: int, text: str, source_chat_id: int, media_msg_ids: list[int]) -> bool:
+    """
+    media_msg_ids — message_id медиа в источнике (MediaItem.file_id) в порядке sort_index.
+    Ошибка после того, как часть текста уже ушла в канал, — PartialPublishError: повторять нельзя.
+    """
     if not client or not client.is_connected():
         logger.error("Client not connected")
         return False
 
     html_text = md_to_html(text)
+    sent = 0  # сообщений уже в целевом канале
 
     try:
-        if has_media and source_chat_id and source_message_id:
-            msg = await client.get_messages(source_chat_id, ids=source_message_id)
-
-            if msg and msg.grouped_id:
-                return await publish_album(client, target_chat_id, html_text, source_chat_id, msg)
-
-            elif msg and has_sendable_media(msg):
-                await client.send_file(
-                    target_chat_id,
-                    msg.media,
-                    caption=html_text,
-                    parse_mode="html"
-                )
+        if media_msg_ids and source_chat_id:
+            async def send(messages: list) -> bool:
+                return await publish_media(client, target_chat_id, html_text, messages)
+
+            # сообщения — из кеша, недостающие одним get_messages по сохранённым message_id
+            if await message_cache.use(client, source_chat_id, media_msg_ids, send):
                 return True
 
-        await send_long_text(client, target_chat_id, html_text, parse_mode="html")
+        for chunk in split_html_safe(html_text, limit=4096) if html_text else []:
+            await client.send_message(target_chat_id, chunk, parse_mode="html", link_preview=False)
+            sent += 1
         return True
 
+    except FloodWaitError as e:
+        if not sent:
+            # в канал ничего не ушло — пул аккаунтов повторит на другом
+            raise
+        error = e
     except Exception as e:
-        logger.error(f"Publish failed: {e}")
-        return False
-
-async def publish_album(client, target_chat_id: int, caption_html: str, source_chat_id: int, first_msg) -> bool:
-    try:
-        grouped_id = first_msg.grouped_id
-        messages = await client.get_messages(
-            source_chat_id,
-            limit=30,
-            max_id=first_msg.id + 20,
-            min_id=first_msg.id - 20
-        )
-        album_msgs = [m for m in messages if m.grouped_id == grouped_id and has_sendable_media(m)]
-        album_msgs.sort(key=lambda m: m.id)
-
-        if not album_msgs:
+        if not sent:
+            logger.error(f"Publish failed: {e}")
             return False
+        error = e
 
-        media_list = [m.media for m in album_msgs]
+    logger.error(f"Publish interrupted after {sent} messages: {error}")
+    raise PartialPublishError(sent, error)
 
-        await client.send_file(
-            target_chat_id,
-            media_list,
-            caption=caption_html,
-            parse_mode="html"
-        )
-        return True
-    except Exception as e:
-        logger.error(f"Album publish failed: {e}")
+async def publish_media(client, target_chat_id: int, caption_html: str, messages: list) -> bool:
+    """Одиночное медиа или альбом. False — медиа в источнике уже нет"""
+    album_msgs = [m for m in messages if m and has_sendable_media(m)]
+    if not album_msgs:
         return False
 
-async def send_long_text(client, chat_id: int, html_text: str, parse_mode: str = "html"):
-    if not html_text:
-        return
-
-    for chunk in split_html_safe(html_text, limit=4096):
-        await client.send_message(chat_id, chunk, parse_mode=parse_mode, link_preview=False)
+    media = [m.media for m in album_msgs] if len(album_msgs) > 1 else album_msgs[0].media
+    await client.send_file(
+        target_chat_id,
+        media,
+        caption=caption_html,
+        parse_mode="html"
+    )
+    return True
@@ -0,0 +1,279 @@
+"""
+src/userbot/shards.py
+Несколько аккаунтов юзербота. Источник закреплён за аккаунтом консистентным хешированием
+(его апдейты слушает только владелец), скачивание и публикация — на наименее загруженном
+аккаунте, который состоит в нужных чатах. FloodWait или обрыв связи — источники аккаунта
+переезжают на следующие по кольцу, после восстановления возвращаются.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterable, TypeVar
+
+from telethon import TelegramClient, utils
+from telethon.errors import FloodWaitError
+from telethon.tl.types import Channel as TelethonChannel
+
+from src.userbot.sources import source_registry
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Сессия основного аккаунта (API_ID/API_HASH/PHONE)
+PRIMARY_SESSION = "userbot_session"
+
+ReassignListener = Callable[[list[int]], None]
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+def _online(client: TelegramClient) -> bool:
+    """
+    is_connected() остаётся True, пока Telethon сам переподключается после обрыва,
+    поэтому смотрим и на флаг переподключения отправителя.
+    """
+    return client.is_connected() and not getattr(client._sender, "_reconnecting", False)
+
+
+def parse_accounts(value: str) -> list[tuple[str, str]]:
+    """USERBOT_ACCOUNTS: "session:+phone,session2:+phone2" → [(session, phone), ...]"""
+    accounts = []
+    for item in value.split(","):
+        session_name, _, phone = item.strip().partition(":")
+        if session_name and phone:
+            accounts.append((session_name.strip(), phone.strip()))
+    return accounts
+
+
+@dataclass(eq=False)
+class Shard:
+    name: str
+    phone: str
+    client: TelegramClient
+    chats: set[int] = field(default_factory=set)  # каналы, где аккаунт состоит (peer id -100...)
+    flood_until: float = 0.0
+    in_flight: int = 0
+    floods: int = 0
+    healthy: bool = False
+
+    def check_health(self) -> bool:
+        return _online(self.client) and time.monotonic() >= self.flood_until
+
+
+class ShardPool:
+    def __init__(self):
+        self.shards: list[Shard] = []
+        self._ring: list[tuple[int, Shard]] = []
+        self._ring_keys: list[int] = []
+        self._owners: dict[int, Shard] = {}
+        self._listeners: list[ReassignListener] = []
+        self._health_task: asyncio.Task | None = None
+        self.moves = 0
+
+        source_registry.on_change(self.reassign)
+
+    # ── жизненный цикл ──────────────────────────────────────────
+
+    async def start(self):
+        accounts = [(PRIMARY_SESSION, settings.PHONE)] + parse_accounts(settings.USERBOT_ACCOUNTS)
+
+        for session_name, phone in accounts:
+            client = TelegramClient(session_name, settings.API_ID, settings.API_HASH)
+            try:
+                await client.start(phone=phone)
+            except Exception as e:
+                if not self.shards:
+                    raise  # без основного аккаунта работать не с чем
+                logger.exception(f"Userbot account {session_name} failed to start: {e}")
+                continue
+
+            shard = Shard(name=session_name, phone=phone, client=client)
+            await self._load_chats(shard)
+            shard.healthy = shard.check_health()
+            self.shards.append(shard)
+            logger.info(f"Userbot account {session_name} connected, {len(shard.chats)} channels")
+
+        vnodes = max(1, settings.SHARD_VNODES)
+        self._ring = sorted(
+            ((_hash(f"{shard.name}#{i}"), shard) for shard in self.shards for i in range(vnodes)),
+            key=lambda point: point[0],
+        )
+        self._ring_keys = [point for point, _ in self._ring]
+
+        self.reassign()
+        self._health_task = asyncio.create_task(self._watch_health())
+
+    async def stop(self):
+        if self._health_task:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for shard in self.shards:
+            await shard.client.disconnect()
+        logger.info("Userbot accounts disconnected")
+
+    @staticmethod
+    async def _load_chats(shard: Shard):
+        shard.chats = {
+            utils.get_peer_id(dialog.entity)
+            async for dialog in shard.client.iter_dialogs()
+            if isinstance(dialog.entity, TelethonChannel)
+        }
+
+    # ── назначение источников ───────────────────────────────────
+
+    @property
+    def primary(self) -> Shard | None:
+        return self.shards[0] if self.shards else None
+
+    def _eligible(self, chat_ids: Iterable[int]) -> list[Shard]:
+        """Аккаунты, состоящие во всех чатах; если таких нет — все"""
+        chat_ids = list(chat_ids)
+        members = [shard for shard in self.shards if all(chat_id in shard.chats for chat_id in chat_ids)]
+        return members or list(self.shards)
+
+    def ring_order(self, chat_id: int) -> list[Shard]:
+        """Разные аккаунты по кольцу начиная с точки chat_id"""
+        order: list[Shard] = []
+        start = bisect.bisect(self._ring_keys, _hash(str(chat_id)))
+        for i in range(len(self._ring)):
+            shard = self._ring[(start + i) % len(self._ring)][1]
+            if shard not in order:
+                order.append(shard)
+        return order
+
+    def _ring_owner(self, chat_id: int) -> Shard | None:
+        """Первый по кольцу здоровый аккаунт из состоящих в чате"""
+        eligible = self._eligible([chat_id])
+        if not self._ring:
+            return None
+
+        start = bisect.bisect(self._ring_keys, _hash(str(chat_id)))
+        for i in range(len(self._ring)):
+            shard = self._ring[(start + i) % len(self._ring)][1]
+            if shard in eligible and shard.healthy:
+                return shard
+
+        # все подходящие лежат — остаётся на своём, дождётся восстановления
+        start_shard = self._ring[start % len(self._ring)][1]
+        return start_shard if start_shard in eligible else eligible[0]
+
+    def owner(self, chat_id: int) -> Shard | None:
+        return self._owners.get(chat_id) or self._ring_owner(chat_id)
+
+    def owner_client(self, chat_id: int) -> TelegramClient | None:
+        shard = self.owner(chat_id)
+        return shard.client if shard else None
+
+    def owned_chats(self, shard: Shard) -> list[int]:
+        return sorted(chat_id for chat_id, owner in self._owners.items() if owner is shard)
+
+    def on_reassign(self, listener: ReassignListener):
+        """listener(chat_ids) — владельцы пересчитаны; chat_ids — источники, которым нужен догон"""
+        self._listeners.append(listener)
+
+    def reassign(self, recovered: Iterable[Shard] = ()):
+        """Пересчитать владельцев всех активных источников"""
+        if not self.shards:
+            return
+
+        recovered = set(recovered)
+        owners = {chat_id: self._ring_owner(chat_id) for chat_id in source_registry.chat_ids()}
+        moved = [
+            chat_id for chat_id, shard in owners.items()
+            if chat_id in self._owners and self._owners[chat_id] is not shard
+        ]
+        # новому владельцу и вернувшемуся аккаунту нужно догнать пропущенное
+        catch_up = sorted(set(moved) | {chat_id for chat_id, shard in owners.items() if shard in recovered})
+
+        self._owners = owners
+        self.moves += len(moved)
+        if moved:
+            logger.info(f"Sources reassigned: {len(moved)} moved")
+
+        for listener in self._listeners:
+            try:
+                listener(catch_up)
+            except Exception as e:
+                logger.exception(f"Reassign listener failed: {e}")
+
+    async def _watch_health(self):
+        while True:
+            await asyncio.sleep(settings.CATCHUP_WATCH_INTERVAL)
+
+            changed, recovered = False, []
+            for shard in self.shards:
+                healthy = shard.check_health()
+                if healthy != shard.healthy:
+                    logger.warning(f"Userbot account {shard.name} is {'back' if healthy else 'unavailable'}")
+                    shard.healthy = healthy
+                    changed = True
+                    if healthy:
+                        recovered.append(shard)
+
+            if changed:
+                self.reassign(recovered)
+
+    # ── работа с API ────────────────────────────────────────────
+
+    def mark_flood(self, shard: Shard, seconds: int):
+        shard.flood_until = max(shard.flood_until, time.monotonic() + seconds)
+        shard.floods += 1
+        logger.warning(f"Userbot account {shard.name}: FloodWait {seconds}s")
+        if shard.healthy:
+            shard.healthy = False
+            self.reassign()
+
+    def shard_of(self, client: TelegramClient) -> Shard | None:
+        return next((shard for shard in self.shards if shard.client is client), None)
+
+    async def run(self, chat_ids: Iterable[int], action: Callable[[TelegramClient | None], Awaitable[T]]) -> T:
+        """
+        Выполнить action на аккаунте, состоящем во всех chat_ids: сначала здоровые
+        по возрастанию загрузки. FloodWait — пометить аккаунт и попробовать следующий.
+        """
+        if not self.shards:
+            return await action(None)
+
+        candidates = sorted(
+            self._eligible(chat_ids),
+            key=lambda shard: (not shard.healthy, shard.in_flight, self.shards.index(shard)),
+        )
+
+        error: FloodWaitError | None = None
+        for shard in candidates:
+            shard.in_flight += 1
+            try:
+                return await action(shard.client)
+            except FloodWaitError as e:
+                self.mark_flood(shard, e.seconds)
+                error = e
+            finally:
+                shard.in_flight -= 1
+
+        raise error
+
+    def stats(self) -> list[dict]:
+        return [
+            {
+                "name": shard.name,
+                "healthy": shard.healthy,
+                "sources": len(self.owned_chats(shard)),
+                "in_flight": shard.in_flight,
+                "floods": shard.floods,
+                "flood_left": max(0.0, shard.flood_until - time.monotonic()),
+            }
+            for shard in self.shards
+        ]
+
+
+# Глобальный экземпляр
+shard_pool = ShardPool()
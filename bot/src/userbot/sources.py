@@ -0,0 +1,223 @@
+"""
+src/userbot/sources.py
+Реестр активных источников в памяти: загружается при старте,
+обновляется хендлерами источников (и через LISTEN/NOTIFY из других процессов).
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import select, update
+
+from src.models.channel import Channel
+from src.utils.config import settings
+from src.utils.db import session
+from src.utils.pg_notify import pg_listener, notify
+
+logger = logging.getLogger(__name__)
+
+SOURCES_CHANNEL = "sources"
+
+
+@dataclass
+class Source:
+    """Снимок строки channels (role=source), не привязанный к сессии"""
+    id: int
+    chat_id: int  # формат бота/Telethon peer id: -100...
+    title: str
+    prerewrite: bool
+    last_message_id: int | None = None  # последний увиденный пост — для догона после простоя
+
+    @classmethod
+    def from_channel(cls, channel: Channel) -> "Source":
+        return cls(
+            id=channel.id,
+            chat_id=channel.chat_id,
+            title=channel.title or "",
+            prerewrite=bool(channel.prerewrite),
+            last_message_id=channel.last_message_id,
+        )
+
+
+class SourceRegistry:
+    """
+    chat_id → Source. На каждое сообщение — только поиск в словаре.
+    Переименования и последний увиденный message_id копятся в памяти
+    и пишутся в БД пачкой (write-behind).
+    """
+
+    def __init__(self):
+        self._sources: dict[int, Source] = {}
+        self._listeners: list[Callable[[], None]] = []
+        self._dirty: dict[int, dict] = {}  # channels.id → ещё не записанные поля
+        self._in_flight: dict[int, set[int]] = {}  # chat_id → принятые, но ещё не записанные message_id
+        self._committed: dict[int, int] = {}  # chat_id → старший записанный message_id
+        self._flush_task: asyncio.Task | None = None
+        self.flushed = 0
+
+    def on_change(self, listener: Callable[[], None]):
+        """Вызвать listener после любого изменения набора источников"""
+        self._listeners.append(listener)
+
+    def _changed(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                logger.exception(f"Sources listener failed: {e}")
+
+    async def load(self):
+        """Полная загрузка из БД (старт или сигнал от другого процесса)"""
+        async with session() as s:
+            channels = (await s.execute(
+                select(Channel).where(
+                    Channel.role == "source",
+                    Channel.is_active == True
+                )
+            )).scalars().all()
+
+        self._sources = {channel.chat_id: Source.from_channel(channel) for channel in channels}
+        logger.info(f"Sources loaded: {len(self._sources)} active sources")
+        self._changed()
+
+    async def update(self, channel: Channel):
+        """Применить изменённую строку channels (добавлен/вкл-выкл/флаги)"""
+        if channel.role == "source" and channel.is_active:
+            source = self._sources[channel.chat_id] = Source.from_channel(channel)
+            # в строке из хендлера могут быть значения старее ещё не записанных
+            for name, value in self._dirty.get(channel.id, {}).items():
+                setattr(source, name, value)
+        else:
+            self._sources.pop(channel.chat_id, None)
+            self._dirty.pop(channel.id, None)
+        self._changed()
+        await notify(SOURCES_CHANNEL)
+
+    async def remove(self, chat_id: int):
+        source = self._sources.pop(chat_id, None)
+        self._in_flight.pop(chat_id, None)
+        self._committed.pop(chat_id, None)
+        if source:
+            # строка channels уже удалена — писать её поля некуда
+            self._dirty.pop(source.id, None)
+        self._changed()
+        await notify(SOURCES_CHANNEL)
+
+    def rename(self, source: Source, title: str):
+        """Новый title канала: в реестре сразу, в БД — при следующем сбросе"""
+        if not title or title == source.title:
+            return
+        source.title = title
+        self._dirty.setdefault(source.id, {})["title"] = title
+
+    def track(self, source: Source, message_id: int):
+        """Сообщение принято в обработку: отметка не перейдёт его, пока пост не записан"""
+        self._in_flight.setdefault(source.chat_id, set()).add(message_id)
+
+    def mark_seen(self, source: Source, *message_ids: int):
+        """
+        Сообщения записаны в БД: сдвинуть отметку (в БД — при следующем сбросе).
+        Отметка не обгоняет ещё не записанные сообщения источника.
+        """
+        if not message_ids:
+            return
+        self._in_flight.get(source.chat_id, set()).difference_update(message_ids)
+        self._committed[source.chat_id] = max(self._committed.get(source.chat_id, 0), *message_ids)
+        self._advance(source)
+
+    def untrack(self, chat_id: int, *message_ids: int):
+        """Сообщения записаны не будут (отброшены, ошибка) — отметку ими не держим"""
+        in_flight = self._in_flight.get(chat_id)
+        if not in_flight:
+            return
+        in_flight.difference_update(message_ids)
+        source = self._sources.get(chat_id)
+        if source:
+            self._advance(source)
+
+    def _advance(self, source: Source):
+        committed = self._committed.get(source.chat_id)
+        if committed is None:
+            return
+
+        in_flight = self._in_flight.get(source.chat_id)
+        if in_flight:
+            committed = min(committed, min(in_flight) - 1)
+        else:
+            self._in_flight.pop(source.chat_id, None)
+            self._committed.pop(source.chat_id, None)
+
+        if source.last_message_id is not None and committed <= source.last_message_id:
+            return
+        source.last_message_id = committed
+        self._dirty.setdefault(source.id, {})["last_message_id"] = committed
+
+    async def flush(self):
+        """Записать накопленные изменения одним UPDATE ... по первичному ключу"""
+        if not self._dirty:
+            return
+
+        pending, self._dirty = self._dirty, {}
+        try:
+            async with session() as s:
+                # строки, удалённые другим процессом, выбрасываем: UPDATE по PK на них падает
+                existing = set((await s.execute(
+                    select(Channel.id).where(Channel.id.in_(list(pending)))
+                )).scalars().all())
+                for channel_id in set(pending) - existing:
+                    del pending[channel_id]
+                if pending:
+                    await s.execute(
+                        update(Channel),
+                        [{"id": channel_id, **values} for channel_id, values in pending.items()],
+                    )
+                    await s.commit()
+            self.flushed += len(pending)
+            logger.info(f"Sources flushed: {len(pending)}")
+        except Exception as e:
+            logger.error(f"Sources flush failed: {e}")
+            # вернуть в буфер, не затирая более свежие
+            for channel_id, values in pending.items():
+                self._dirty[channel_id] = {**values, **self._dirty.get(channel_id, {})}
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.SOURCE_TITLE_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flush_task:
+            self._flush_task.cancel()
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        await self.flush()
+
+    def get(self, chat_id: int | None) -> Source | None:
+        return self._sources.get(chat_id) if chat_id is not None else None
+
+    def all(self) -> list[Source]:
+        return list(self._sources.values())
+
+    def chat_ids(self) -> list[int]:
+        return sorted(self._sources)
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+
+# Глобальный экземпляр
+source_registry = SourceRegistry()
+
+
+async def _reload_sources(_: str):
+    await source_registry.load()
+
+
+# Другой процесс изменил источники — перечитываем
+pg_listener.subscribe(SOURCES_CHANNEL, _reload_sources)
@@ -1,11 +1,17 @@
+import asyncio
+from typing import AsyncIterator
+
 import anthropic
+import httpx
 
 from sqlalchemy import select
 from sqlalchemy.dialects.postgresql import insert
 
 from src.utils.config import settings
 from src.utils.db import session
+from src.utils.pg_notify import pg_listener, notify
 from src.models.ai_settings import AISettings
+from src.utils.rewrite_cache import rewrite_cache, make_key
 
 # Дефолтные значения
 DEFAULT_MODEL = "claude-haiku-4-5-20251001"
@@ -50,35 +56,135 @@ DEFAULT_PROMPTS = {
 }
 
 
+_client: anthropic.AsyncAnthropic | None = None
+_semaphore: asyncio.Semaphore | None = None
+
+
+def get_client() -> anthropic.AsyncAnthropic:
+    """
+    Долгоживущий async-клиент Anthropic.
+    Один пул соединений (keep-alive) на весь процесс.
+    """
+    global _client
+    if _client is None:
+        http_client = anthropic.DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max(settings.ANTHROPIC_MAX_CONCURRENCY, settings.ANTHROPIC_KEEPALIVE_CONNECTIONS),
+                max_keepalive_connections=settings.ANTHROPIC_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.ANTHROPIC_KEEPALIVE_EXPIRY,
+            ),
+        )
+        _client = anthropic.AsyncAnthropic(
+            api_key=settings.ANTHROPIC_API_KEY,
+            base_url=settings.ANTHROPIC_BASE_URL or None,
+            timeout=httpx.Timeout(settings.ANTHROPIC_TIMEOUT, connect=10.0),
+            max_retries=settings.ANTHROPIC_MAX_RETRIES,
+            http_client=http_client,
+        )
+    return _client
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Ограничение одновременных запросов к API"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, settings.ANTHROPIC_MAX_CONCURRENCY))
+    return _semaphore
+
+
+async def close_client() -> None:
+    """Закрыть пул соединений (при остановке бота)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
 def is_enabled() -> bool:
     """Проверяет, задан ли API-ключ Anthropic"""
     return bool(settings.ANTHROPIC_API_KEY)
 
 
-async def get_ai_setting(key: str, default: str = "") -> str:
-    """Получить настройку AI из БД"""
+# ─────────────────────────────────────────────────────────────
+# Снимок таблицы ai_settings в памяти
+# ─────────────────────────────────────────────────────────────
+
+AI_SETTINGS_CHANNEL = "ai_settings"
+
+_snapshot: dict[str, str] | None = None
+_snapshot_version = 0
+_snapshot_lock = asyncio.Lock()
+
+
+async def load_settings() -> dict[str, str]:
+    """Загрузить всю таблицу ai_settings одним запросом"""
+    global _snapshot, _snapshot_version
     async with session() as s:
-        result = await s.execute(
-            select(AISettings.value).where(AISettings.key == key)
-        )
-        row = result.scalar()
-        return row if row is not None else default
+        rows = (await s.execute(select(AISettings.key, AISettings.value))).all()
 
+    _snapshot = {key: value for key, value in rows}
+    _snapshot_version += 1
+    return _snapshot
+
+
+async def _get_snapshot() -> dict[str, str]:
+    if _snapshot is not None:
+        return _snapshot
+    async with _snapshot_lock:
+        if _snapshot is None:
+            await load_settings()
+    return _snapshot
+
+
+def invalidate_settings(_payload: str = "") -> None:
+    """Сбросить снимок — следующее чтение перечитает таблицу"""
+    global _snapshot
+    _snapshot = None
+
+
+def settings_version() -> int:
+    """Версия снимка (растёт при каждой загрузке/записи)"""
+    return _snapshot_version
+
+
+pg_listener.subscribe(AI_SETTINGS_CHANNEL, invalidate_settings)
+
+
+async def get_ai_setting(key: str, default: str = "") -> str:
+    """Получить настройку AI (из снимка в памяти)"""
+    snapshot = await _get_snapshot()
+    value = snapshot.get(key)
+    return value if value is not None else default
+
+
+async def set_ai_settings(values: dict[str, str]) -> None:
+    """Записать несколько настроек одним upsert + обновить снимок (write-through)"""
+    global _snapshot, _snapshot_version
+    if not values:
+        return
 
-async def set_ai_setting(key: str, value: str) -> None:
-    """Установить настройку AI в БД (upsert)"""
     async with session() as s:
-        stmt = (
-            insert(AISettings)
-            .values(key=key, value=value)
-            .on_conflict_do_update(
-                index_elements=[AISettings.key],
-                set_={"value": value}
-            )
+        stmt = insert(AISettings).values(
+            [{"key": key, "value": value} for key, value in values.items()]
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[AISettings.key],
+            set_={"value": stmt.excluded.value}
         )
         await s.execute(stmt)
         await s.commit()
 
+    snapshot = await _get_snapshot()
+    _snapshot = {**snapshot, **values}
+    _snapshot_version += 1
+
+    await notify(AI_SETTINGS_CHANNEL)
+
+
+async def set_ai_setting(key: str, value: str) -> None:
+    """Установить настройку AI в БД (upsert)"""
+    await set_ai_settings({key: value})
+
 
 async def get_model() -> str:
     """Получить текущую модель Claude"""
@@ -90,17 +196,66 @@ async def set_model(model: str) -> None:
     await set_ai_setting("model", model)
 
 
+def _prompt_key(mode: str) -> str:
+    return f"prompt_{mode}" if mode != "std" else "prompt"
+
+
 async def get_prompt(mode: str = "std") -> str:
     """Получить промпт для режима переписывания"""
-    key = f"prompt_{mode}" if mode != "std" else "prompt"
+    key = _prompt_key(mode)
     default = DEFAULT_PROMPTS.get(mode, DEFAULT_PROMPTS["std"])
     return await get_ai_setting(key, default)
 
 
 async def set_prompt(mode: str, prompt: str) -> None:
     """Установить промпт для режима переписывания"""
-    key = f"prompt_{mode}" if mode != "std" else "prompt"
-    await set_ai_setting(key, prompt)
+    await set_ai_setting(_prompt_key(mode), prompt)
+
+
+async def reset_settings() -> None:
+    """Сбросить модель и все промпты на дефолт (одна запись в БД)"""
+    values = {"model": DEFAULT_MODEL}
+    for mode, prompt in DEFAULT_PROMPTS.items():
+        values[_prompt_key(mode)] = prompt
+    await set_ai_settings(values)
+
+
+async def get_prompt_cache() -> bool:
+    """Включено ли кеширование системного промпта (cache_control)"""
+    return await get_ai_setting("prompt_cache", "0") == "1"
+
+
+async def set_prompt_cache(enabled: bool) -> None:
+    await set_ai_setting("prompt_cache", "1" if enabled else "0")
+
+
+def build_system(system_prompt: str, cache: bool) -> str | list[dict]:
+    """Системный промпт; с кешем — блок с cache_control"""
+    if not cache:
+        return system_prompt
+    return [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+
+
+# Счётчики токенов (в т.ч. чтение/запись кеша промпта)
+_usage = {
+    "requests": 0,
+    "input_tokens": 0,
+    "output_tokens": 0,
+    "cache_read_input_tokens": 0,
+    "cache_creation_input_tokens": 0,
+}
+
+
+def record_usage(usage) -> None:
+    if usage is None:
+        return
+    _usage["requests"] += 1
+    for key in ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens"):
+        _usage[key] += getattr(usage, key, None) or 0
+
+
+def usage_stats() -> dict:
+    return dict(_usage)
 
 
 async def get_all_settings() -> dict:
@@ -112,7 +267,7 @@ async def get_all_settings() -> dict:
     return {"model": model, "prompts": prompts}
 
 
-async def rewrite_text(text: str, mode: str = "std") -> str:
+async def rewrite_text(text: str, mode: str = "std", fresh: bool = False) -> str:
     """
     Переписать текст с помощью Claude API
 
@@ -120,6 +275,9 @@ async def rewrite_text(text: str, mode: str = "std") -> str:
       - "std" — стандартный рерайт
       - "short" — сокращённый
       - "creative" — креативный
+
+    fresh=True — не брать результат из кеша (кнопка «Переписать ещё»),
+    новый ответ перезапишет закешированный.
     """
     if not is_enabled():
         raise RuntimeError("ANTHROPIC_API_KEY не задан")
@@ -130,18 +288,77 @@ async def rewrite_text(text: str, mode: str = "std") -> str:
     model = await get_model()
     system_prompt = await get_prompt(mode)
 
-    client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+    cache_key = make_key(model, system_prompt, mode, text)
+    if not fresh:
+        cached = await rewrite_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    client = get_client()
+    system = build_system(system_prompt, await get_prompt_cache())
+
+    async with _get_semaphore():
+        message = await client.messages.create(
+            model=model,
+            max_tokens=4096,
+            system=system,
+            messages=[
+                {"role": "user", "content": text}
+            ]
+        )
+
+    record_usage(message.usage)
+    result = message.content[0].text.strip()
+    if result:
+        await rewrite_cache.put(cache_key, model, mode, result)
+    return result
 
-    message = client.messages.create(
-        model=model,
-        max_tokens=4096,
-        system=system_prompt,
-        messages=[
-            {"role": "user", "content": text}
-        ]
-    )
 
-    return message.content[0].text.strip()
+async def stream_rewrite(text: str, mode: str = "std", fresh: bool = False) -> AsyncIterator[str]:
+    """
+    Потоковый рерайт: отдаёт накопленный текст по мере прихода токенов.
+    Последнее значение — полный ответ (он же кладётся в кеш).
+    Закешированный результат отдаётся одним куском.
+    """
+    if not is_enabled():
+        raise RuntimeError("ANTHROPIC_API_KEY не задан")
+
+    if not text.strip():
+        yield ""
+        return
+
+    model = await get_model()
+    system_prompt = await get_prompt(mode)
+
+    cache_key = make_key(model, system_prompt, mode, text)
+    if not fresh:
+        cached = await rewrite_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    client = get_client()
+    system = build_system(system_prompt, await get_prompt_cache())
+    acc = ""
+
+    async with _get_semaphore():
+        async with client.messages.stream(
+            model=model,
+            max_tokens=4096,
+            system=system,
+            messages=[
+                {"role": "user", "content": text}
+            ]
+        ) as stream:
+            async for delta in stream.text_stream:
+                acc += delta
+                yield acc
+            record_usage((await stream.get_final_message()).usage)
+
+    result = acc.strip()
+    if result:
+        await rewrite_cache.put(cache_key, model, mode, result)
+    yield result
 
 
 # Список доступных моделей Claude для выбора
@@ -0,0 +1,211 @@
+"""
+src/utils/ai_batch.py
+Рерайт бэклога постов через Message Batches API
+"""
+
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+
+from sqlalchemy import func, select
+
+from src.models.post import Post
+from src.utils.ai import (
+    get_ai_setting,
+    set_ai_setting,
+    get_client,
+    get_model,
+    get_prompt,
+    get_prompt_cache,
+    build_system,
+    record_usage,
+    is_enabled,
+)
+from src.utils.config import settings
+from src.utils.db import session
+from src.utils.rewrite_cache import rewrite_cache, make_key
+from src.utils.tg_format import md_to_html
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+# Отправленный batch (id, модель, режим, ключи кеша) — в ai_settings, чтобы догнать его после рестарта
+BATCH_SETTING = "backlog_batch"
+
+_task: asyncio.Task | None = None
+
+
+def is_running() -> bool:
+    return _task is not None and not _task.done()
+
+
+def start_backlog_rewrite(mode: str = "std", progress: ProgressCallback | None = None) -> bool:
+    """Запустить фоновую задачу (одна на процесс). False — уже идёт"""
+    global _task
+    if is_running():
+        return False
+    _task = asyncio.create_task(_run(mode, progress))
+    return True
+
+
+async def resume_backlog_rewrite():
+    """При старте: если batch был отправлен до рестарта — дождаться его результатов"""
+    if await get_ai_setting(BATCH_SETTING) and is_enabled():
+        start_backlog_rewrite()
+
+
+async def _run(mode: str, progress: ProgressCallback | None):
+    try:
+        await rewrite_backlog(mode, progress)
+    except Exception as e:
+        logger.exception(f"Backlog rewrite failed: {e}")
+        await _report(progress, f"❌ Рерайт бэклога прерван: {e}")
+
+
+async def _report(progress: ProgressCallback | None, text: str):
+    logger.info(text)
+    if progress:
+        try:
+            await progress(text)
+        except Exception as e:
+            logger.debug(f"Progress callback failed: {e}")
+
+
+async def rewrite_backlog(mode: str = "std", progress: ProgressCallback | None = None) -> dict:
+    """
+    Собрать непереписанные посты, отправить одним Message Batch,
+    дождаться результатов и заполнить Post.rewritten_text.
+    Уже закешированные рерайты применяются сразу, без запроса к API.
+    Если сохранён batch, отправленный до рестарта, — сначала дожидаемся его.
+    """
+    stats = {"total": 0, "cached": 0, "succeeded": 0, "failed": 0}
+
+    if not is_enabled():
+        await _report(progress, "❌ ANTHROPIC_API_KEY не задан")
+        return stats
+
+    saved = await get_ai_setting(BATCH_SETTING)
+    if saved:
+        pending = json.loads(saved)
+        stats["total"] = len(pending["keys"])
+        await _report(progress, f"📦 Batch <code>{pending['id']}</code>: дожидаюсь ранее отправленного batch")
+        results = await _collect_batch(pending, progress, stats)
+        await _apply(results)
+        await _report_done(progress, stats)
+        return stats
+
+    async with session() as s:
+        rows = (await s.execute(
+            select(Post.id, Post.original_text)
+            .where(Post.rewritten_text.is_(None), func.trim(Post.original_text) != "")
+            .order_by(Post.id.asc())
+            .limit(settings.BATCH_MAX_POSTS)
+        )).all()
+
+    stats["total"] = len(rows)
+    if not rows:
+        await _report(progress, "📦 Бэклог пуст — переписывать нечего")
+        return stats
+
+    model = await get_model()
+    system_prompt = await get_prompt(mode)
+    system = build_system(system_prompt, await get_prompt_cache())
+
+    results: dict[int, str] = {}
+    keys: dict[int, str] = {}
+    requests = []
+    for post_id, text in rows:
+        key = make_key(model, system_prompt, mode, text)
+        cached = await rewrite_cache.get(key)
+        if cached is not None:
+            results[post_id] = cached
+            stats["cached"] += 1
+            continue
+
+        keys[post_id] = key
+        requests.append({
+            "custom_id": f"post-{post_id}",
+            "params": {
+                "model": model,
+                "max_tokens": 4096,
+                "system": system,
+                "messages": [{"role": "user", "content": text}],
+            },
+        })
+
+    # закешированное применяем сразу — не зависит от судьбы batch
+    await _apply(results)
+
+    if requests:
+        batch = await get_client().messages.batches.create(requests=requests)
+        pending = {"id": batch.id, "model": model, "mode": mode, "keys": {str(k): v for k, v in keys.items()}}
+        await set_ai_setting(BATCH_SETTING, json.dumps(pending))
+        await _report(progress, f"📦 Batch <code>{batch.id}</code>: отправлено {len(requests)} постов")
+
+        await _apply(await _collect_batch(pending, progress, stats))
+
+    await _report_done(progress, stats)
+    return stats
+
+
+async def _collect_batch(pending: dict, progress: ProgressCallback | None, stats: dict) -> dict[int, str]:
+    """Дождаться окончания batch и забрать результаты (в кеш рерайтов — тоже)"""
+    client = get_client()
+    batch_id = pending["id"]
+    keys: dict[str, str] = pending["keys"]
+
+    batch = await client.messages.batches.retrieve(batch_id)
+    while batch.processing_status != "ended":
+        await asyncio.sleep(settings.BATCH_POLL_INTERVAL)
+        batch = await client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        done = counts.succeeded + counts.errored + counts.canceled + counts.expired
+        await _report(
+            progress,
+            f"📦 Batch <code>{batch_id}</code>: {done}/{len(keys)} готово "
+            f"(ошибок {counts.errored + counts.expired})"
+        )
+
+    results: dict[int, str] = {}
+    async for item in await client.messages.batches.results(batch_id):
+        post_id = item.custom_id.removeprefix("post-")
+        if item.result.type != "succeeded":
+            stats["failed"] += 1
+            continue
+
+        record_usage(item.result.message.usage)
+        text = item.result.message.content[0].text.strip()
+        if not text:
+            stats["failed"] += 1
+            continue
+
+        results[int(post_id)] = text
+        stats["succeeded"] += 1
+        await rewrite_cache.put(keys[post_id], pending["model"], pending["mode"], text)
+
+    # результаты забраны — после рестарта ждать больше нечего
+    await set_ai_setting(BATCH_SETTING, "")
+    return results
+
+
+async def _apply(results: dict[int, str]):
+    """Заполняем только то, что за время batch никто не переписал вручную"""
+    if not results:
+        return
+    async with session() as s:
+        posts = (await s.execute(
+            select(Post).where(Post.id.in_(list(results)), Post.rewritten_text.is_(None))
+        )).scalars().all()
+        for post in posts:
+            post.rewritten_text = md_to_html(results[post.id])
+        await s.commit()
+
+
+async def _report_done(progress: ProgressCallback | None, stats: dict):
+    await _report(
+        progress,
+        f"✅ Бэклог переписан: {stats['succeeded'] + stats['cached']}/{stats['total']} "
+        f"(из кеша {stats['cached']}, ошибок {stats['failed']})"
+    )
@@ -1,3 +1,4 @@
+from datetime import time
 from pathlib import Path
 from typing import List
 
@@ -21,9 +22,97 @@ class Settings(BaseSettings):
     POSTGRES_DB_NAME: str
 
     ADMIN_IDS: List[int]
+    NOTIFY_CONCURRENCY: int = 5  # сколько админов уведомляем одновременно
+    # Outbox уведомлений админам: повторы с экспоненциальной задержкой
+    OUTBOX_BATCH: int = 20  # строк за один захват
+    OUTBOX_POLL_INTERVAL: float = 5.0
+    OUTBOX_LEASE: float = 120.0  # захваченная строка вернётся в очередь, если воркер пропал
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_BACKOFF_BASE: float = 2.0
+    OUTBOX_BACKOFF_MAX: float = 600.0
+
+    # Медиа для превью: до лимита — в памяти, больше — во временный файл
+    MEDIA_SPOOL_MAX_MEMORY: int = 8 * 1024 * 1024
+    MEDIA_SPOOL_DIR: str = ""
+    MEDIA_UPLOAD_CHUNK: int = 256 * 1024
+    MEDIA_MAX_INFLIGHT_BYTES: int = 256 * 1024 * 1024  # на все превью сразу
+    MEDIA_DOWNLOAD_CONCURRENCY: int = 4  # параллельные загрузки элементов альбома
+    # Кеш Telethon-сообщений источников (превью/публикация без повторных get_messages)
+    MESSAGE_CACHE_SIZE: int = 1024
+    MESSAGE_CACHE_TTL: float = 3600.0
+    # Сборка альбомов: ожидание после последней части подстраивается под источник
+    ALBUM_WAIT_MIN: float = 0.8
+    ALBUM_WAIT_MAX: float = 2.5  # пока интервалы источника неизвестны
+    ALBUM_WAIT_FACTOR: float = 4.0  # ожидание = FACTOR × средний интервал между частями
+    ALBUM_WAIT_HARD_CAP: float = 6.0  # от первой части альбома
+    # Переименования источников и отметки последнего поста пишутся в БД пачкой раз в N секунд
+    SOURCE_TITLE_FLUSH_INTERVAL: float = 30.0
+    # Групповая запись новых постов: окно сбора пачки и её максимальный размер
+    INGEST_BATCH_WINDOW: float = 0.05
+    INGEST_BATCH_MAX: int = 100
+    # Очередь между обработчиком Telethon и воркерами приёма
+    INGEST_QUEUE_SIZE: int = 1000
+    INGEST_WORKERS: int = 4
+    INGEST_OVERFLOW: str = "block"  # block | drop_oldest | spill (в таблицу ingest_spill)
+    INGEST_SPILL_POLL: float = 2.0
+    # Догон постов, пропущенных за время простоя/разрыва
+    CATCHUP_ENABLED: bool = True
+    CATCHUP_CONCURRENCY: int = 3  # источников одновременно
+    CATCHUP_MAX_MESSAGES: int = 500  # на источник за один догон
+    CATCHUP_WATCH_INTERVAL: float = 1.0  # проверка переподключения (без запросов к API), секунды
+    # Дополнительные аккаунты юзербота: "session:+phone,session2:+phone2"
+    # (основной — API_ID/API_HASH/PHONE, сессия userbot_session)
+    USERBOT_ACCOUNTS: str = ""
+    SHARD_VNODES: int = 64  # точек на аккаунт в кольце консистентного хеширования
+    SHARD_JOIN_REPLICAS: int = 2  # сколькими аккаунтами вступать в новый источник
+    # Отложенная публикация: слоты каждые N минут внутри окон, не чаще MIN_GAP
+    PUBLISH_SLOT_INTERVAL: int = 60  # минут; 0 — без сетки, только MIN_GAP
+    PUBLISH_WINDOWS: str = ""  # "09:00-13:00,18:00-23:30"; пусто — круглые сутки
+    PUBLISH_MIN_GAP: int = 15  # минут между публикациями из очереди
+    PUBLISH_TIMEZONE: str = "Europe/Moscow"
+    PUBLISH_MAX_ATTEMPTS: int = 3
+    PUBLISH_RETRY_DELAY: float = 300.0  # секунд до повтора неудачной публикации
 
     ANTHROPIC_API_KEY: str = ""
 
+    # Лимиты исходящих запросов Bot API (сообщений в секунду)
+    BOT_GLOBAL_RATE: float = 25.0
+    BOT_CHAT_RATE: float = 1.0
+    BOT_GROUP_RATE: float = 0.33
+    BOT_CHAT_BURST: float = 3.0
+    BOT_RETRY_ATTEMPTS: int = 3
+    # Пул async-клиента Anthropic
+    ANTHROPIC_MAX_CONCURRENCY: int = 4
+    ANTHROPIC_TIMEOUT: float = 60.0
+    ANTHROPIC_MAX_RETRIES: int = 2
+    ANTHROPIC_KEEPALIVE_CONNECTIONS: int = 4
+    ANTHROPIC_KEEPALIVE_EXPIRY: float = 60.0
+    ANTHROPIC_BASE_URL: str = ""  # например, локальный stub-сервер для тестов
+
+    # Рерайт бэклога через Message Batches API
+    BATCH_MAX_POSTS: int = 500
+    BATCH_POLL_INTERVAL: float = 30.0
+
+    # Фоновый рерайт новых постов (только для источников с включённым флагом)
+    PREREWRITE_ENABLED: bool = False
+    PREREWRITE_MODES: str = "std"  # через запятую: std,short,creative
+    PREREWRITE_DAILY_BUDGET: int = 200  # максимум запросов к API в сутки
+    PREREWRITE_CONCURRENCY: int = 2
+
+    # Межпроцессная инвалидация кешей через LISTEN/NOTIFY
+    PG_NOTIFY_ENABLED: bool = False
+
+    # Очередь задач рерайта из админки
+    REWRITE_WORKERS: int = 3
+    REWRITE_QUEUE_SIZE: int = 50
+
+    # Потоковое превью рерайта (правка одного сообщения по мере генерации)
+    REWRITE_STREAMING: bool = True
+    REWRITE_STREAM_EDIT_INTERVAL: float = 1.5  # секунд между edit_message_text в одном чате
+
+    # Кеш рерайтов (LRU в памяти, поверх таблицы rewrite_cache)
+    REWRITE_CACHE_SIZE: int = 512
+
     model_config = SettingsConfigDict(env_file=ENV_PATH)
 
     @field_validator("ADMIN_IDS", mode="before")
@@ -41,6 +130,25 @@ class Settings(BaseSettings):
     def DATABASE_URL_asyncpg(self):
         return f"postgresql+asyncpg://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB_NAME}"
 
+    @property
+    def prerewrite_modes(self) -> list[str]:
+        return [m.strip() for m in self.PREREWRITE_MODES.split(",") if m.strip()]
+
+    @property
+    def publish_windows(self) -> list[tuple[time, time]]:
+        """PUBLISH_WINDOWS → [(начало, конец)]; конец раньше начала — окно через полночь"""
+        windows = []
+        for part in self.PUBLISH_WINDOWS.split(","):
+            if not part.strip():
+                continue
+            start, end = part.split("-")
+            windows.append((time.fromisoformat(start.strip()), time.fromisoformat(end.strip())))
+        return windows
+
+    @property
+    def DATABASE_DSN(self):
+        return f"postgresql://{self.POSTGRES_USER}:{self.POSTGRES_PASSWORD}@{self.POSTGRES_HOST}:{self.POSTGRES_PORT}/{self.POSTGRES_DB_NAME}"
+
     @property
     def userbot_enabled(self) -> bool:
         return bool(self.API_ID and self.API_HASH and self.PHONE)
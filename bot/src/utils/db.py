@@ -1,5 +1,6 @@
 from contextlib import asynccontextmanager
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, async_session, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 
@@ -23,11 +24,25 @@ async def session():
             await s.rollback()
             raise
 
+# create_all не добавляет новые колонки в уже существующие таблицы
+COLUMN_PATCHES: list[str] = [
+    "ALTER TABLE channels ADD COLUMN IF NOT EXISTS prerewrite BOOLEAN NOT NULL DEFAULT FALSE",
+    "ALTER TABLE media_items ADD COLUMN IF NOT EXISTS bot_file_id VARCHAR(256)",
+    "ALTER TABLE channels ADD COLUMN IF NOT EXISTS last_message_id BIGINT",
+    # дубли одиночных постов, записанные до уникального индекса, — оставляем первый
+    "DELETE FROM posts a USING posts b WHERE a.source_chat_id = b.source_chat_id "
+    "AND a.source_message_id = b.source_message_id AND a.id > b.id",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_post_source_message ON posts (source_chat_id, source_message_id)",
+]
+
+
 async def create_tables() -> None:
     if engine is None:
         raise RuntimeError("DB engine is not initialized.")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        for ddl in COLUMN_PATCHES:
+            await conn.execute(text(ddl))
 
 async def close_db() -> None:
     await engine.dispose()
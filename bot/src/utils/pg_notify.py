@@ -0,0 +1,86 @@
+"""
+src/utils/pg_notify.py
+Межпроцессные сигналы через PostgreSQL LISTEN/NOTIFY
+"""
+
+import asyncio
+import inspect
+import logging
+import uuid
+from typing import Any, Callable
+
+import asyncpg
+from sqlalchemy import text
+
+from src.utils.config import settings
+from src.utils.db import session
+
+logger = logging.getLogger(__name__)
+
+# Метка процесса: свои же уведомления игнорируем
+_PROCESS_TOKEN = uuid.uuid4().hex
+
+
+class PgListener:
+    """Одно выделенное соединение asyncpg на все подписки"""
+
+    def __init__(self):
+        self._conn: asyncpg.Connection | None = None
+        self._handlers: dict[str, list[Callable[[str], Any]]] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def subscribe(self, channel: str, handler: Callable[[str], Any]):
+        """Подписать обработчик (sync или async) на канал"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    async def start(self):
+        if not settings.PG_NOTIFY_ENABLED or self._conn is not None:
+            return
+
+        self._conn = await asyncpg.connect(settings.DATABASE_DSN)
+        for channel in self._handlers:
+            await self._conn.add_listener(channel, self._dispatch)
+
+        logger.info(f"LISTEN started: {', '.join(self._handlers) or '-'}")
+
+    async def stop(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        for task in list(self._tasks):
+            task.cancel()
+
+    def _dispatch(self, conn, pid: int, channel: str, payload: str):
+        token, _, data = payload.partition(":")
+        if token == _PROCESS_TOKEN:
+            return
+
+        for handler in self._handlers.get(channel, []):
+            try:
+                result = handler(data)
+                if inspect.isawaitable(result):
+                    task = asyncio.ensure_future(result)
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                logger.exception(f"NOTIFY handler failed ({channel}): {e}")
+
+
+async def notify(channel: str, data: str = "") -> None:
+    """Отправить сигнал другим процессам (no-op, если выключено)"""
+    if not settings.PG_NOTIFY_ENABLED:
+        return
+
+    try:
+        async with session() as s:
+            await s.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": channel, "payload": f"{_PROCESS_TOKEN}:{data}"},
+            )
+            await s.commit()
+    except Exception as e:
+        logger.error(f"NOTIFY {channel} failed: {e}")
+
+
+# Глобальный экземпляр
+pg_listener = PgListener()
@@ -0,0 +1,87 @@
+"""
+src/utils/prerewrite.py
+Фоновый (спекулятивный) рерайт постов сразу после сохранения
+"""
+
+import asyncio
+import datetime
+import logging
+
+from src.utils.ai import is_enabled, rewrite_text
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PreRewriter:
+    """
+    Ставит рерайт в фон для настроенных режимов.
+    Результаты попадают в кеш рерайтов (ключ включает режим),
+    поэтому кнопка p:{id}:rw:{mode} отдаёт готовый текст сразу.
+    """
+
+    def __init__(self):
+        self._tasks: dict[tuple[int, str], asyncio.Task] = {}
+        self._semaphore: asyncio.Semaphore | None = None
+        self._budget_day: datetime.date | None = None
+        self._spent = 0
+
+    def _take_budget(self) -> bool:
+        """Суточный лимит запросов"""
+        today = datetime.date.today()
+        if self._budget_day != today:
+            self._budget_day = today
+            self._spent = 0
+
+        if self._spent >= settings.PREREWRITE_DAILY_BUDGET:
+            return False
+
+        self._spent += 1
+        return True
+
+    def schedule(self, post_id: int, text: str) -> None:
+        """Поставить фоновые рерайты для поста"""
+        if not settings.PREREWRITE_ENABLED or not is_enabled() or not (text or "").strip():
+            return
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(max(1, settings.PREREWRITE_CONCURRENCY))
+
+        for mode in settings.prerewrite_modes:
+            key = (post_id, mode)
+            if key in self._tasks:
+                continue
+
+            if not self._take_budget():
+                logger.warning(f"Pre-rewrite budget exhausted ({settings.PREREWRITE_DAILY_BUDGET}/day)")
+                return
+
+            task = asyncio.create_task(self._run(post_id, mode, text))
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t, k=key: self._tasks.pop(k, None))
+
+    async def _run(self, post_id: int, mode: str, text: str):
+        async with self._semaphore:
+            try:
+                await rewrite_text(text, mode)
+                logger.info(f"⚡ Pre-rewrite ready: post #{post_id} ({mode})")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Pre-rewrite failed for post #{post_id} ({mode}): {e}")
+
+    async def wait(self, post_id: int, mode: str) -> None:
+        """Дождаться фонового рерайта, если он ещё идёт"""
+        task = self._tasks.get((post_id, mode))
+        if task and not task.done():
+            await asyncio.wait({task})
+
+    def cancel(self, post_id: int) -> None:
+        """Отменить фоновые рерайты поста (например, при удалении)"""
+        for (pid, mode), task in list(self._tasks.items()):
+            if pid == post_id:
+                task.cancel()
+
+
+# Глобальный экземпляр
+prerewriter = PreRewriter()
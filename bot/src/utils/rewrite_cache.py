@@ -0,0 +1,104 @@
+"""
+src/utils/rewrite_cache.py
+Кеш рерайтов: LRU в памяти + таблица rewrite_cache в PostgreSQL
+"""
+
+import hashlib
+import logging
+from collections import OrderedDict
+
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+
+from src.models.rewrite_cache import RewriteCacheEntry
+from src.utils.config import settings
+from src.utils.db import session
+
+logger = logging.getLogger(__name__)
+
+
+def _sha256(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация исходника: одинаковый текст с разными пробелами → один ключ"""
+    return "\n".join(" ".join(line.split()) for line in text.strip().splitlines() if line.strip())
+
+
+def make_key(model: str, system_prompt: str, mode: str, text: str) -> str:
+    """Ключ кеша: (модель, хеш промпта, режим, хеш нормализованного текста)"""
+    parts = (model, _sha256(system_prompt), mode, _sha256(normalize_text(text)))
+    return _sha256("|".join(parts))
+
+
+class RewriteCache:
+    """Двухуровневый кеш рерайтов"""
+
+    def __init__(self, max_size: int):
+        self._mem: OrderedDict[str, str] = OrderedDict()
+        self._max_size = max_size
+        self.hits_mem = 0
+        self.hits_db = 0
+        self.misses = 0
+
+    def _remember(self, key: str, text: str):
+        self._mem[key] = text
+        self._mem.move_to_end(key)
+        while len(self._mem) > self._max_size:
+            self._mem.popitem(last=False)
+
+    async def get(self, key: str) -> str | None:
+        """Найти рерайт: сначала память, потом БД"""
+        text = self._mem.get(key)
+        if text is not None:
+            self._mem.move_to_end(key)
+            self.hits_mem += 1
+            return text
+
+        try:
+            async with session() as s:
+                text = (await s.execute(
+                    select(RewriteCacheEntry.rewritten_text).where(RewriteCacheEntry.cache_key == key)
+                )).scalar()
+        except Exception as e:
+            logger.error(f"Rewrite cache lookup failed: {e}")
+            text = None
+
+        if text is not None:
+            self._remember(key, text)
+            self.hits_db += 1
+            return text
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, model: str, mode: str, text: str) -> None:
+        """Сохранить рерайт в оба уровня (свежий результат перезаписывает старый)"""
+        self._remember(key, text)
+        try:
+            async with session() as s:
+                stmt = (
+                    insert(RewriteCacheEntry)
+                    .values(cache_key=key, model=model, mode=mode, rewritten_text=text)
+                    .on_conflict_do_update(
+                        index_elements=[RewriteCacheEntry.cache_key],
+                        set_={"rewritten_text": text},
+                    )
+                )
+                await s.execute(stmt)
+                await s.commit()
+        except Exception as e:
+            logger.error(f"Rewrite cache store failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "hits_mem": self.hits_mem,
+            "hits_db": self.hits_db,
+            "misses": self.misses,
+            "size": len(self._mem),
+        }
+
+
+# Глобальный экземпляр
+rewrite_cache = RewriteCache(settings.REWRITE_CACHE_SIZE)
@@ -0,0 +1,178 @@
+"""
+src/utils/rewrite_scheduler.py
+Очередь задач рерайта: ограниченный пул воркеров, схлопывание повторов, отмена
+"""
+
+import asyncio
+import itertools
+import logging
+from typing import Awaitable, Callable
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+JobFactory = Callable[[], Awaitable[None]]
+
+
+class _Job:
+    __slots__ = ("admin_id", "post_id", "mode", "factory", "enqueued_at", "task", "cancelled")
+
+    def __init__(self, admin_id: int, post_id: int, mode: str, factory: JobFactory, enqueued_at: float):
+        self.admin_id = admin_id
+        self.post_id = post_id
+        self.mode = mode
+        self.factory = factory
+        self.enqueued_at = enqueued_at
+        self.task: asyncio.Task | None = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.task and not self.task.done():
+            self.task.cancel()
+
+
+class RewriteScheduler:
+    """
+    Одна активная задача на пару (админ, пост): повторный клик того же режима
+    присоединяется к идущей, другой режим заменяет её. Приоритет — порядок админа в ADMIN_IDS.
+    """
+
+    def __init__(self):
+        self._queue: asyncio.PriorityQueue | None = None
+        self._jobs: dict[tuple[int, int], _Job] = {}
+        self._workers: list[asyncio.Task] = []
+        self._seq = itertools.count()
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.cancelled = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._runs = 0
+
+    def start(self):
+        if self._workers:
+            return
+        self._queue = asyncio.PriorityQueue(maxsize=max(1, settings.REWRITE_QUEUE_SIZE))
+        self._workers = [
+            asyncio.create_task(self._worker(i)) for i in range(max(1, settings.REWRITE_WORKERS))
+        ]
+        logger.info(f"Rewrite scheduler started: {len(self._workers)} workers")
+
+    async def stop(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    @staticmethod
+    def _priority(admin_id: int) -> int:
+        try:
+            return settings.ADMIN_IDS.index(admin_id)
+        except ValueError:
+            return len(settings.ADMIN_IDS)
+
+    def submit(self, admin_id: int, post_id: int, factory: JobFactory, mode: str = "std") -> bool:
+        """Поставить рерайт в очередь. False — очередь переполнена"""
+        if self._queue is None:
+            self.start()
+
+        key = (admin_id, post_id)
+        old = self._jobs.get(key)
+        if old and not old.cancelled:
+            if old.mode == mode:
+                # тот же рерайт уже в очереди или идёт — не платим за него второй раз
+                self.coalesced += 1
+                return True
+            if old.task is None:
+                # ещё не начат — подменяем задачу на её же месте в очереди
+                old.mode = mode
+                old.factory = factory
+                self.coalesced += 1
+                return True
+
+        if self._queue.full():
+            self.rejected += 1
+            logger.warning(f"Rewrite queue full, rejected post #{post_id} for admin {admin_id}")
+            return False
+
+        if old:
+            old.cancel()
+            self.coalesced += 1
+
+        job = _Job(admin_id, post_id, mode, factory, asyncio.get_running_loop().time())
+        self._queue.put_nowait((self._priority(admin_id), next(self._seq), job))
+        self._jobs[key] = job
+        self.submitted += 1
+        return True
+
+    def cancel_post(self, post_id: int):
+        """Отменить все задачи по посту (например, пост удалён)"""
+        for key, job in list(self._jobs.items()):
+            if job.post_id == post_id:
+                job.cancel()
+                self._jobs.pop(key, None)
+
+    async def _worker(self, n: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                if job.cancelled:
+                    self.cancelled += 1
+                    continue
+
+                started = loop.time()
+                waited = started - job.enqueued_at
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
+
+                job.task = asyncio.create_task(job.factory())
+                await asyncio.wait({job.task})
+
+                self._runs += 1
+                self._run_total += loop.time() - started
+                if job.task.cancelled():
+                    self.cancelled += 1
+                elif job.task.exception():
+                    self.failed += 1
+                    logger.error(f"Rewrite job for post #{job.post_id} failed: {job.task.exception()}")
+                else:
+                    self.completed += 1
+
+                logger.info(
+                    f"Rewrite job post #{job.post_id} (admin {job.admin_id}): "
+                    f"wait {waited:.2f}s, run {loop.time() - started:.2f}s, queue {self._queue.qsize()}"
+                )
+            finally:
+                if self._jobs.get((job.admin_id, job.post_id)) is job:
+                    del self._jobs[(job.admin_id, job.post_id)]
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        runs = self._runs
+        return {
+            "queue": self._queue.qsize() if self._queue else 0,
+            "active": len(self._jobs),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "cancelled": self.cancelled,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "wait_avg": self._wait_total / runs if runs else 0.0,
+            "wait_max": self._wait_max,
+            "run_avg": self._run_total / runs if runs else 0.0,
+        }
+
+
+# Глобальный экземпляр
+rewrite_scheduler = RewriteScheduler()
@@ -119,4 +119,49 @@ def split_caption_and_tail(html_text: str, caption_limit: int = 1024) -> tuple[s
     cut = _safe_cut_html(html_text, caption_limit)
     caption = html_text[:cut].strip()
     tail = html_text[cut:].lstrip()
-    return caption, tail
\ No newline at end of file
+    return caption, tail
+
+
+_OPEN_CLOSE_RE = re.compile(r"<(/?)(b|i|u|s|code|pre|strong|em)\b[^>]*>", re.IGNORECASE)
+
+
+def safe_html_prefix(html_text: str, limit: int = 4096) -> str:
+    """
+    Превращает недописанный (потоковый) HTML в валидное сообщение:
+    - отрезает незакрытый тег/сущность в конце
+    - режет по правилам split_html_safe, если текст длиннее limit
+    - выкидывает незакрытую <a ...>
+    - закрывает открытые b/i/u/s/code/pre
+    """
+    t = html_text.strip()
+
+    # незакрытый "<b" / "<a href=..."
+    lt = t.rfind("<")
+    if lt > t.rfind(">"):
+        t = t[:lt]
+
+    # незакрытая сущность "&am"
+    amp = t.rfind("&")
+    if amp != -1 and ";" not in t[amp:] and len(t) - amp < 10:
+        t = t[:amp]
+
+    # запас под закрывающие теги
+    reserve = 64
+    if len(t) > limit - reserve:
+        t = t[:_safe_cut_html(t, limit - reserve)]
+
+    low = t.lower()
+    if low.count("<a ") > low.count("</a>"):
+        t = t[:low.rfind("<a ")]
+
+    stack: List[str] = []
+    for m in _OPEN_CLOSE_RE.finditer(t):
+        name = m.group(2).lower()
+        if m.group(1):
+            if name in stack:
+                while stack and stack.pop() != name:
+                    pass
+        else:
+            stack.append(name)
+
+    return t.rstrip() + "".join(f"</{name}>" for name in reversed(stack))
@@ -0,0 +1,120 @@
+"""
+src/utils/throttle.py
+Лимитер исходящих запросов Bot API: token bucket глобально и на каждый чат + retry_after
+"""
+
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import DeleteMessage, DeleteMessages, SendMediaGroup, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from src.utils.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket с «долгом»: дорогой запрос (альбом) ждёт полного бака и уводит его в минус"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, cost: float = 1.0):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+
+                delay = max(self._blocked_until - now, 0.0)
+                need = min(cost, self.capacity)
+                if not delay and self._tokens >= need:
+                    self._tokens -= cost
+                    return
+
+                await asyncio.sleep(delay or (need - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """Telegram вернул retry_after — бак закрыт до указанного момента"""
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = min(self._tokens, 0.0)
+
+    @property
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self._tokens >= self.capacity and not self._lock.locked()
+
+
+class SendThrottleMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии aiogram: все запросы с chat_id проходят
+    через бак чата и глобальный бак. На 429 ждём retry_after и повторяем.
+    Удаления под лимит сообщений в чат не попадают — только глобальный бак,
+    иначе уборка превью альбома растягивается на секунды.
+    """
+
+    def __init__(self):
+        self._global = TokenBucket(settings.BOT_GLOBAL_RATE, settings.BOT_GLOBAL_RATE)
+        self._chats: dict[int | str, TokenBucket] = {}
+        self.flood_waits = 0
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 1000:
+                self._chats = {k: b for k, b in self._chats.items() if not b.idle}
+
+            # личка — ~1 сообщение/сек, группы и каналы — ~20 в минуту
+            is_private = isinstance(chat_id, int) and chat_id > 0
+            rate = settings.BOT_CHAT_RATE if is_private else settings.BOT_GROUP_RATE
+            bucket = TokenBucket(rate, settings.BOT_CHAT_BURST)
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None:
+            return await make_request(bot, method)
+
+        cost = len(method.media) if isinstance(method, SendMediaGroup) else 1
+        bucket = None if isinstance(method, (DeleteMessage, DeleteMessages)) else self._chat_bucket(chat_id)
+
+        attempt = 0
+        while True:
+            # альбом опустошает бак чата, но не уводит его в глубокий минус
+            if bucket:
+                await bucket.acquire(min(cost, bucket.capacity))
+            await self._global.acquire(cost)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self.flood_waits += 1
+                attempt += 1
+                if attempt > settings.BOT_RETRY_ATTEMPTS:
+                    raise
+                logger.warning(
+                    f"Flood wait {e.retry_after}s on {type(method).__name__} to {chat_id} "
+                    f"(attempt {attempt}/{settings.BOT_RETRY_ATTEMPTS})"
+                )
+                if bucket:
+                    bucket.pause(e.retry_after)
+                else:
+                    await asyncio.sleep(e.retry_after)
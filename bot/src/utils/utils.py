@@ -1,3 +1,5 @@
+import json
+
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from aiogram.types import Message
@@ -25,3 +27,38 @@ async def safe_delete_message(bot: Bot, chat_id: int, message_id: int) -> bool:
         return False
     except Exception:
         return False
+
+
+def dump_admin_messages(delivered: dict[int, list[int]]) -> str:
+    """{admin_id: [message_id, ...]} → JSON для Post.preview_msg_ids"""
+    return json.dumps({str(admin_id): ids for admin_id, ids in delivered.items()})
+
+
+def load_admin_messages(
+        preview_msg_ids: str | None,
+        control_msg_id: int | None,
+        fallback_admin_id: int
+) -> dict[int, list[int]]:
+    """
+    Разобрать Post.preview_msg_ids.
+    Старый формат — плоский список + control_msg_id (считаем, что это чат fallback_admin_id).
+    """
+    if not preview_msg_ids:
+        data = []
+    else:
+        data = json.loads(preview_msg_ids)
+
+    if isinstance(data, dict):
+        return {int(admin_id): [int(mid) for mid in ids] for admin_id, ids in data.items()}
+
+    ids = [int(mid) for mid in data]
+    if control_msg_id:
+        ids.append(int(control_msg_id))
+    return {fallback_admin_id: ids} if ids else {}
+
+
+async def delete_admin_messages(bot: Bot, messages: dict[int, list[int]]) -> None:
+    """Удалить уведомления о посте у всех админов"""
+    for admin_id, ids in messages.items():
+        for msg_id in ids:
+            await safe_delete_message(bot, admin_id, msg_id)
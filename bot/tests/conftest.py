@@ -0,0 +1,23 @@
+"""
+Тесты ходят в отдельную тестовую БД PostgreSQL (docker-compose: порт 5435).
+TEST_POSTGRES_DB_NAME — имя базы, по умолчанию tgchannelbot_test; без БД тесты пропускаются.
+"""
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+os.environ.setdefault("BOT_TOKEN", "123456:test")
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("PHONE", "+10000000000")
+os.environ.setdefault("POSTGRES_USER", "root")
+os.environ.setdefault("POSTGRES_PASSWORD", "root")
+os.environ.setdefault("POSTGRES_HOST", "127.0.0.1")
+os.environ.setdefault("POSTGRES_PORT", "5435")
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+# никогда не рабочая база: тесты чистят таблицы
+os.environ["POSTGRES_DB_NAME"] = os.environ.get("TEST_POSTGRES_DB_NAME", "tgchannelbot_test")
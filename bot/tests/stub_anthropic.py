@@ -0,0 +1,134 @@
+"""
+tests/stub_anthropic.py
+Локальный stub Message Batches API для тестов рерайта бэклога.
+
+Запуск вручную: python -m tests.stub_anthropic  (из каталога bot),
+затем ANTHROPIC_BASE_URL=http://127.0.0.1:8765
+"""
+
+import asyncio
+import itertools
+import json
+from datetime import datetime, timedelta, timezone
+
+from aiohttp import web
+
+STUB_PREFIX = "REWRITTEN: "
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class StubAnthropic:
+    """
+    Batch завершается после polls_until_end запросов retrieve.
+    Ответ на каждый запрос — STUB_PREFIX + текст поста.
+    """
+
+    def __init__(self, polls_until_end: int = 1):
+        self.polls_until_end = polls_until_end
+        self.batches: dict[str, dict] = {}
+        self.created = 0
+        self.url = ""
+        self._ids = itertools.count(1)
+        self._runner: web.AppRunner | None = None
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/messages/batches", self._create)
+        app.router.add_get("/v1/messages/batches/{batch_id}", self._retrieve)
+        app.router.add_get("/v1/messages/batches/{batch_id}/results", self._results)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self._app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def _batch_json(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = batch["polls"] >= self.polls_until_end
+        total = len(batch["requests"])
+        return {
+            "id": batch_id,
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": total if ended else 0,
+                "errored": 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": batch["created_at"],
+            "expires_at": batch["expires_at"],
+            "ended_at": _now() if ended else None,
+            "cancel_initiated_at": None,
+            "archived_at": None,
+            "results_url": f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    async def _create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        batch_id = f"msgbatch_stub_{next(self._ids)}"
+        now = datetime.now(timezone.utc)
+        self.batches[batch_id] = {
+            "requests": body["requests"],
+            "polls": 0,
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(days=1)).isoformat(),
+        }
+        self.created += 1
+        return web.json_response(self._batch_json(batch_id))
+
+    async def _retrieve(self, request: web.Request) -> web.Response:
+        batch_id = request.match_info["batch_id"]
+        if batch_id not in self.batches:
+            return web.json_response(
+                {"type": "error", "error": {"type": "not_found_error", "message": batch_id}}, status=404
+            )
+        self.batches[batch_id]["polls"] += 1
+        return web.json_response(self._batch_json(batch_id))
+
+    async def _results(self, request: web.Request) -> web.Response:
+        batch = self.batches[request.match_info["batch_id"]]
+        lines = []
+        for item in batch["requests"]:
+            params = item["params"]
+            lines.append(json.dumps({
+                "custom_id": item["custom_id"],
+                "result": {
+                    "type": "succeeded",
+                    "message": {
+                        "id": f"msg_{item['custom_id']}",
+                        "type": "message",
+                        "role": "assistant",
+                        "model": params["model"],
+                        "content": [{"type": "text", "text": STUB_PREFIX + params["messages"][0]["content"]}],
+                        "stop_reason": "end_turn",
+                        "stop_sequence": None,
+                        "usage": {"input_tokens": 1, "output_tokens": 1},
+                    },
+                },
+            }))
+        return web.Response(text="\n".join(lines) + "\n", content_type="application/x-jsonl")
+
+
+async def _main():
+    stub = StubAnthropic()
+    print(f"Stub Anthropic API on {await stub.start(port=8765)}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
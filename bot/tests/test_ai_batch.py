@@ -0,0 +1,109 @@
+"""
+Рерайт бэклога через Message Batches API против локального stub-сервера:
+отправка, опрос, запись результатов и продолжение после рестарта.
+"""
+
+import asyncio
+
+import asyncpg
+import pytest
+from sqlalchemy import delete, select
+
+from src.models.ai_settings import AISettings
+from src.models.post import Post
+from src.models.rewrite_cache import RewriteCacheEntry
+from src.utils import ai, ai_batch
+from src.utils.config import settings
+from src.utils.db import close_db, create_tables, session
+from src.utils.rewrite_cache import rewrite_cache
+from tests.stub_anthropic import STUB_PREFIX, StubAnthropic
+
+
+async def _setup(stub: StubAnthropic, texts: list[str]) -> list[int]:
+    try:
+        await create_tables()
+    except (OSError, asyncpg.PostgresError) as e:
+        pytest.skip(f"Test PostgreSQL unavailable: {e}")
+
+    async with session() as s:
+        await s.execute(delete(Post))
+        await s.execute(delete(AISettings))
+        await s.execute(delete(RewriteCacheEntry))
+        posts = [Post(source_chat_id=-1001, source_message_id=i, original_text=t) for i, t in enumerate(texts, 1)]
+        s.add_all(posts)
+        await s.commit()
+        ids = [post.id for post in posts]
+
+    rewrite_cache._mem.clear()
+    ai.invalidate_settings()
+    settings.ANTHROPIC_BASE_URL = await stub.start()
+    settings.BATCH_POLL_INTERVAL = 0.01
+    return ids
+
+
+async def _teardown(stub: StubAnthropic):
+    await ai.close_client()
+    await stub.stop()
+    await close_db()
+
+
+async def _rewritten(ids: list[int]) -> dict[int, str | None]:
+    async with session() as s:
+        rows = (await s.execute(select(Post.id, Post.rewritten_text).where(Post.id.in_(ids)))).all()
+    return dict(rows)
+
+
+def test_backlog_submit_poll_apply():
+    async def scenario():
+        stub = StubAnthropic(polls_until_end=3)
+        ids = await _setup(stub, ["first post", "second post", "   "])
+        try:
+            stats = await ai_batch.rewrite_backlog()
+
+            assert stats == {"total": 2, "cached": 0, "succeeded": 2, "failed": 0}
+            assert stub.created == 1
+            batch = next(iter(stub.batches.values()))
+            assert [r["params"]["messages"][0]["content"] for r in batch["requests"]] == ["first post", "second post"]
+
+            rewritten = await _rewritten(ids)
+            assert rewritten[ids[0]] == STUB_PREFIX + "first post"
+            assert rewritten[ids[1]] == STUB_PREFIX + "second post"
+            assert rewritten[ids[2]] is None  # пустые посты в API не уходят
+            assert await ai.get_ai_setting(ai_batch.BATCH_SETTING) == ""
+        finally:
+            await _teardown(stub)
+
+    asyncio.run(scenario())
+
+
+def test_backlog_resumes_batch_after_restart():
+    async def scenario():
+        stub = StubAnthropic(polls_until_end=10_000)
+        ids = await _setup(stub, ["first post", "second post"])
+        try:
+            task = asyncio.create_task(ai_batch.rewrite_backlog())
+            while not stub.batches:
+                await asyncio.sleep(0.01)
+            while not await ai.get_ai_setting(ai_batch.BATCH_SETTING):
+                await asyncio.sleep(0.01)
+
+            # «рестарт»: задача убита, клиент и снимок настроек — заново
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await ai.close_client()
+            ai.invalidate_settings()
+            assert set((await _rewritten(ids)).values()) == {None}
+
+            stub.polls_until_end = 0
+            stats = await ai_batch.rewrite_backlog()
+
+            assert stub.created == 1  # дождались старый batch, новый не отправляли
+            assert stats["succeeded"] == 2
+            rewritten = await _rewritten(ids)
+            assert rewritten[ids[0]] == STUB_PREFIX + "first post"
+            assert rewritten[ids[1]] == STUB_PREFIX + "second post"
+            assert await ai.get_ai_setting(ai_batch.BATCH_SETTING) == ""
+        finally:
+            await _teardown(stub)
+
+    asyncio.run(scenario())